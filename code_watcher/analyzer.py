@@ -1,23 +1,292 @@
 import ast
+import io
 import os
 import builtins
+import hashlib
+from collections import deque
 
 # -----------------------------
 # Analyze whole project
 # -----------------------------
-def analyze_project(project_path):
+def analyze_project(project_path, previous_graph=None, fingerprints=None, workers=1, chunksize=16,
+                    stats=None, changed_only=False):
     """
     Walk the project folder and analyze all Python files.
     Returns a graph of variables/functions with their dependencies.
+
+    If fingerprints ({file_path: {"mtime", "size", "hash"}}) and the graph
+    from a previous run are given, files whose content is unchanged reuse
+    their cached graph instead of being parsed again. fingerprints is
+    updated in place to describe the files seen by this scan.
+
+    With changed_only=True, only the graphs of files that were parsed are
+    returned and previous_graph is not used: a file whose fingerprint
+    still matches is unchanged in the graph cache that fingerprints came
+    from, so its cached graph is never read.
+
+    With workers > 1, hashing, parsing and graph building run in a process
+    pool that receives the files in batches of chunksize.
+
+    If stats (a dict) is given, it is updated in place with the number of
+    files "reused" (stat unchanged), "unchanged" (content hash unchanged)
+    and "parsed".
     """
-    graph = {}
+    file_paths = []
     for root, _, files in os.walk(project_path):
         for file in files:
             if file.endswith(".py"):
-                file_path = os.path.join(root, file)
-                file_graph = build_full_graph_for_file(file_path)
-                graph[file_path] = file_graph
-    return graph
+                file_paths.append(os.path.join(root, file))
+
+    previous_graph = previous_graph or {}
+    results = {}
+    tasks = []
+    for file_path in file_paths:
+        cached_graph = None if changed_only else previous_graph.get(file_path)
+        entry = (fingerprints or {}).get(file_path) if changed_only or cached_graph is not None else None
+        if entry and _stat_matches(file_path, entry):
+            if not changed_only:
+                results[file_path] = cached_graph
+        else:
+            tasks.append((file_path, entry.get("hash") if entry else None))
+
+    if workers and workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor  # multiprocessing is slow to import
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            analyzed = list(pool.map(analyze_file, tasks, chunksize=max(1, chunksize)))
+    else:
+        analyzed = [analyze_file(task) for task in tasks]
+
+    for file_path, fingerprint, file_graph in analyzed:
+        if fingerprints is not None:
+            if fingerprint:
+                fingerprints[file_path] = fingerprint
+            else:
+                fingerprints.pop(file_path, None)
+        if file_graph is not None:
+            results[file_path] = file_graph
+        elif not changed_only:
+            results[file_path] = previous_graph[file_path]
+
+    if stats is not None:
+        parsed = sum(1 for _, _, g in analyzed if g is not None)
+        stats["reused"] = len(file_paths) - len(tasks)
+        stats["unchanged"] = len(tasks) - parsed
+        stats["parsed"] = parsed
+
+    if fingerprints is not None:
+        for stale in set(fingerprints) - set(file_paths):
+            del fingerprints[stale]
+        reused = len(file_paths) - sum(1 for _, _, g in analyzed if g is not None)
+        print(f" Reused {reused} cached file graph(s), analyzed {len(file_paths) - reused} file(s).")
+
+    # Keep os.walk order so the result does not depend on the worker count
+    return {file_path: results[file_path] for file_path in file_paths if file_path in results}
+
+
+# -----------------------------
+# Source text
+# -----------------------------
+def split_lines(text):
+    """
+    Split text into lines, keeping line ends, like readlines() on a file
+    opened in text mode. Unlike str.splitlines(), form feeds and other
+    Unicode line breaks do not end a line, so line numbers match ast's.
+    """
+    return io.StringIO(text, newline=None).readlines()
+
+
+# -----------------------------
+# Content fingerprints
+# -----------------------------
+def _stat_matches(file_path, entry):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    return entry.get("mtime") == stat.st_mtime_ns and entry.get("size") == stat.st_size
+
+
+def analyze_file(task):
+    """
+    Fingerprint and analyze one file; runs inside the process pool.
+    task is (file_path, cached_hash). Returns (file_path, fingerprint, file_graph),
+    where file_graph is None if the content still hashes to cached_hash.
+    """
+    file_path, cached_hash = task
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return file_path, None, build_full_graph_for_file(file_path)
+
+    digest = hashlib.sha1(data).hexdigest()
+    fingerprint = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest}
+    if cached_hash == digest:
+        return file_path, fingerprint, None
+
+    try:
+        code = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return file_path, fingerprint, build_full_graph_for_file(file_path)
+    return file_path, fingerprint, AnalysisSession(file_path, code=code).graph
+
+
+# -----------------------------
+# Per-change analysis session
+# -----------------------------
+class AnalysisSession:
+    """
+    Reads and parses one file once per change event.
+    The source, line list, AST and dependency graph are computed lazily
+    and shared by every stage of the change pipeline.
+    """
+
+    def __init__(self, file_path, code=None):
+        self.file_path = file_path
+        self.file_name = os.path.splitext(os.path.basename(file_path))[0]
+        self.exists = code is not None or os.path.exists(file_path)
+        self._code = code
+        self._lines = None
+        self._tree = None
+        self._parsed = False
+        self._graph = None
+        self._propagator = None
+        self._definitions = None
+
+    @property
+    def code(self):
+        if self._code is None:
+            self._code = "".join(self.lines)
+        return self._code
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            if self._code is not None:
+                self._lines = split_lines(self._code)
+            elif self.exists:
+                with open(self.file_path, "r", encoding="utf-8") as f:
+                    self._lines = f.readlines()
+            else:
+                self._lines = []
+        return self._lines
+
+    @property
+    def tree(self):
+        """Parsed AST, or None if the file is missing or fails to parse."""
+        if not self._parsed:
+            self._parsed = True
+            if self.exists:
+                try:
+                    self._tree = ast.parse(self.code)
+                except Exception as e:
+                    print(f"❌ Failed to parse {self.file_path}: {e}")
+        return self._tree
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = build_graph_from_tree(self.tree, self.file_name)
+        return self._graph
+
+    @property
+    def propagator(self):
+        if self._propagator is None:
+            self._propagator = ImpactPropagator(self.graph)
+        return self._propagator
+
+    @property
+    def definitions(self):
+        """{qualified_name: [(start_line, end_line), ...]} for graph functions and variables."""
+        if self._definitions is None:
+            self._definitions = get_definition_ranges(self.tree, self.file_name)
+        return self._definitions
+
+
+# -----------------------------
+# Impact propagation
+# -----------------------------
+def normalize_name(name):
+    """Trim nested scopes like test1.fn1.fn2.var -> test1.var"""
+    parts = name.split(".")
+    if len(parts) > 2:
+        # Keep only filename + last part (to unify scopes)
+        return f"{parts[0]}.{parts[-1]}"
+    return name
+
+
+class ImpactPropagator:
+    """
+    Reverse adjacency over normalized names for one file graph.
+    A node is impacted when any of its normalized dependencies is impacted;
+    propagate() reaches the closure in a single worklist pass.
+    """
+
+    def __init__(self, file_graph):
+        self.keys = {}        # (kind, name) -> normalized name
+        self.dependents = {}  # normalized dependency -> [(kind, name), ...]
+        self.by_short_name = {"variables": {}, "functions": {}}  # kind -> short name -> [names]
+        for kind in ("variables", "functions"):
+            for name, info in file_graph.get(kind, {}).items():
+                node = (kind, name)
+                self.keys[node] = normalize_name(name)
+                self.by_short_name[kind].setdefault(name.split(".")[-1], []).append(name)
+                for dep in {normalize_name(d) for d in info.get("depends_on", [])}:
+                    self.dependents.setdefault(dep, []).append(node)
+
+    def propagate(self, seeds):
+        """
+        Given normalized seed names, return (impacted_vars, impacted_funcs):
+        every node that transitively depends on a seed.
+        """
+        reached = set(seeds)
+        worklist = deque(reached)
+        impacted = set()
+        while worklist:
+            key = worklist.popleft()
+            for node in self.dependents.get(key, ()):
+                if node in impacted:
+                    continue
+                impacted.add(node)
+                node_key = self.keys[node]
+                if node_key not in reached:
+                    reached.add(node_key)
+                    worklist.append(node_key)
+
+        impacted_vars = {name for kind, name in impacted if kind == "variables"}
+        impacted_funcs = {name for kind, name in impacted if kind == "functions"}
+        return impacted_vars, impacted_funcs
+
+    def propagate_bits(self, seeds):
+        """
+        Bitset variant of propagate(). seeds maps normalized names to int
+        bitmasks; returns {(kind, name): mask} where each set bit means the
+        node is impacted from a seed carrying that bit. One pass serves
+        every bit at once.
+        """
+        key_masks = dict(seeds)
+        node_masks = {}
+        worklist = deque(key_masks)
+        queued = set(key_masks)
+        while worklist:
+            key = worklist.popleft()
+            queued.discard(key)
+            mask = key_masks[key]
+            for node in self.dependents.get(key, ()):
+                old_mask = node_masks.get(node, 0)
+                new_mask = old_mask | mask
+                if new_mask == old_mask:
+                    continue
+                node_masks[node] = new_mask
+                node_key = self.keys[node]
+                key_mask = key_masks.get(node_key, 0)
+                if key_mask | new_mask != key_mask:
+                    key_masks[node_key] = key_mask | new_mask
+                    if node_key not in queued:
+                        queued.add(node_key)
+                        worklist.append(node_key)
+        return node_masks
 
 
 # -----------------------------
@@ -32,21 +301,17 @@ def build_full_graph_for_file(file_path):
     }
     Qualifies each name as file[.class][.function].name.
     """
+    return AnalysisSession(file_path).graph
+
+
+def build_graph_from_tree(tree, file_name):
+    """Build the variable/function dependency graph for an already parsed module."""
     graph = {"variables": {}, "functions": {}}
-    if not os.path.exists(file_path):
+    if tree is None:
         return graph
 
-    file_name = os.path.splitext(os.path.basename(file_path))[0]
     builtin_names = set(dir(builtins))
 
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            code = f.read()
-        tree = ast.parse(code)
-    except Exception as e:
-        print(f"❌ Failed to parse {file_path}: {e}")
-        return graph
-
     class Analyzer(ast.NodeVisitor):
         def __init__(self, file_name, graph):
             self.file_name = file_name
@@ -149,21 +414,18 @@ def build_full_graph_for_file(file_path):
 # -----------------------------
 # Find affected functions by line numbers
 # -----------------------------
-def get_functions_at_lines(file_path, line_numbers):
+def get_functions_at_lines(file_path, line_numbers, session=None):
     """
     Given line numbers, return the function names that contain those lines.
     """
-    file_graph = build_full_graph_for_file(file_path)
+    session = session or AnalysisSession(file_path)
     affected_functions = set()
-    
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            code = f.read()
-        tree = ast.parse(code)
-    except Exception:
+
+    tree = session.tree
+    if tree is None:
         return affected_functions
     
-    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    file_name = session.file_name
     
     class FunctionFinder(ast.NodeVisitor):
         def __init__(self, file_name):
@@ -206,96 +468,157 @@ def get_functions_at_lines(file_path, line_numbers):
     return affected_functions
 
 
+# -----------------------------
+# Definition line ranges
+# -----------------------------
+def get_definition_ranges(tree, file_name):
+    """
+    Map the qualified names used in the dependency graph to the line ranges
+    (lineno..end_lineno) of their definitions: the whole body for functions,
+    the assignment statement for variables.
+    """
+    ranges = {}
+    if tree is None:
+        return ranges
+
+    class RangeFinder(ast.NodeVisitor):
+        def __init__(self):
+            self.current_class = []
+            self.current_func = []
+
+        def qualify(self, name):
+            return ".".join([file_name] + self.current_class + self.current_func + [name])
+
+        def add(self, name, node):
+            end = getattr(node, "end_lineno", None) or node.lineno
+            ranges.setdefault(self.qualify(name), []).append((node.lineno, end))
+
+        def visit_ClassDef(self, node):
+            self.current_class.append(node.name)
+            self.generic_visit(node)
+            self.current_class.pop()
+
+        def visit_FunctionDef(self, node):
+            # Same naming as the graph: the function is qualified inside its own scope
+            self.current_func.append(node.name)
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            end = getattr(node, "end_lineno", None) or node.lineno
+            ranges.setdefault(self.qualify(node.name), []).append((start, end))
+            self.generic_visit(node)
+            self.current_func.pop()
+
+        def visit_Assign(self, node):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.add(target.id, node)
+            self.generic_visit(node)
+
+    RangeFinder().visit(tree)
+    return ranges
+
+
 # -----------------------------
 # Find affected lines
 # -----------------------------
-def analyze_file_changes(file_path, changed_lines):
+def analyze_file_changes(file_path, changed_lines, session=None):
     """
     Given changed lines, return affected variable and function names.
     Expands impact through the dependency graph (normalized across scopes).
     """
-    file_graph = build_full_graph_for_file(file_path)
+    session = session or AnalysisSession(file_path)
     affected_vars, affected_funcs = set(), set()
-    added_vars, added_funcs = set(), set()
-    deleted_vars, deleted_funcs = set(), set()
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
 
     # -----------------------------
     # STEP 1 – Detect directly changed items
     # -----------------------------
-    for i, line in enumerate(lines, start=1):
-        if i not in changed_lines:
-            continue
+    for line_vars, line_funcs in find_directly_changed(session, changed_lines).values():
+        affected_vars |= line_vars
+        affected_funcs |= line_funcs
+
+    # -----------------------------
+    # STEP 2 – Expand impact through the graph (normalized across scopes)
+    # -----------------------------
+    seeds = {normalize_name(n) for n in affected_vars | affected_funcs}
+    impacted_vars, impacted_funcs = session.propagator.propagate(seeds)
+    affected_vars |= impacted_vars
+    affected_funcs |= impacted_funcs
+
+    return affected_vars, affected_funcs
+
+
+def find_directly_changed(session, changed_lines):
+    """
+    Return {line_num: (vars, funcs)} for the changed lines that define a
+    function or assign a variable, matched by unqualified name.
+    """
+    by_short_name = session.propagator.by_short_name
+    lines = session.lines
+    direct = {}
 
+    for line_num in sorted(set(changed_lines)):
+        if not 1 <= line_num <= len(lines):
+            continue
+        line = lines[line_num - 1]
         stripped = line.strip()
 
         if stripped.startswith("def "):
             func_name = stripped.split("def ")[1].split("(")[0].strip()
-            for f_name in file_graph["functions"]:
-                if f_name.endswith(f".{func_name}"):
-                    affected_funcs.add(f_name)
+            direct[line_num] = (set(), set(by_short_name["functions"].get(func_name, ())))
             continue
 
-        if "=" in line and not line.strip().startswith("#"):
+        if "=" in line and not stripped.startswith("#"):
             left_side = line.split("=")[0].strip()
             var_name = left_side.split(".")[-1]
-            for v in file_graph["variables"]:
-                if v.endswith(f".{var_name}"):
-                    affected_vars.add(v)
+            direct[line_num] = (set(by_short_name["variables"].get(var_name, ())), set())
 
-    # -----------------------------
-    # STEP 2 – Normalize helper
-    # -----------------------------
-    def normalize(name):
-        """Trim nested scopes like test1.fn1.fn2.var -> test1.var"""
-        parts = name.split(".")
-        if len(parts) > 2:
-            # Keep only filename + last part (to unify scopes)
-            return f"{parts[0]}.{parts[-1]}"
-        return name
+    return direct
 
-    normalized_vars = {normalize(v) for v in affected_vars}
-    normalized_funcs = {normalize(f) for f in affected_funcs}
 
-    # -----------------------------
-    # STEP 3 – Recursive expansion with normalization
-    # -----------------------------
-    def expand_impacts():
-        changed = True
-        while changed:
-            changed = False
-            for var, info in file_graph["variables"].items():
-                deps = {normalize(d) for d in info["depends_on"]}
-                if any(d in normalized_vars or d in normalized_funcs for d in deps):
-                    if var not in affected_vars:
-                        affected_vars.add(var)
-                        normalized_vars.add(normalize(var))
-                        changed = True
-
-            for func, info in file_graph["functions"].items():
-                deps = {normalize(d) for d in info["depends_on"]}
-                if any(d in normalized_vars or d in normalized_funcs for d in deps):
-                    if func not in affected_funcs:
-                        affected_funcs.add(func)
-                        normalized_funcs.add(normalize(func))
-                        changed = True
-
-    expand_impacts()
+# -----------------------------
+# Per-line impact attribution
+# -----------------------------
+def attribute_changed_lines(file_path, changed_lines, session=None):
+    """
+    Per-line impact for all changed lines in a single propagation pass.
+    Returns {line_num: (affected_vars, affected_funcs)}; each entry equals
+    analyze_file_changes(file_path, [line_num]).
+    """
+    session = session or AnalysisSession(file_path)
+    line_order = sorted(set(changed_lines))
+    direct = find_directly_changed(session, line_order)
+    attribution = {
+        line_num: (set(direct.get(line_num, (set(), set()))[0]),
+                   set(direct.get(line_num, (set(), set()))[1]))
+        for line_num in line_order
+    }
 
-    return affected_vars, affected_funcs
+    # Each changed line owns one bit; seeds carry the bits of the lines that name them
+    seeds = {}
+    for index, line_num in enumerate(line_order):
+        line_vars, line_funcs = attribution[line_num]
+        for name in line_vars | line_funcs:
+            key = normalize_name(name)
+            seeds[key] = seeds.get(key, 0) | (1 << index)
+
+    for (kind, name), mask in session.propagator.propagate_bits(seeds).items():
+        slot = 0 if kind == "variables" else 1
+        while mask:
+            low_bit = mask & -mask
+            attribution[line_order[low_bit.bit_length() - 1]][slot].add(name)
+            mask ^= low_bit
+
+    return attribution
 
 
 # -----------------------------
 # Track added variables
 # -----------------------------
-def get_added_variables(file_path, old_graph):
+def get_added_variables(file_path, old_graph, session=None):
     """
     Compare old graph with current file to find newly added variables/functions.
     Returns (added_vars, added_funcs)
     """
-    new_graph = build_full_graph_for_file(file_path)
+    new_graph = (session or AnalysisSession(file_path)).graph
     
     old_vars = set(old_graph.get("variables", {}).keys())
     new_vars = set(new_graph.get("variables", {}).keys())
@@ -312,12 +635,13 @@ def get_added_variables(file_path, old_graph):
 # -----------------------------
 # Track deleted variables and their downstream impact
 # -----------------------------
-def get_deleted_variables_impact(file_path, old_graph, full_project_graph):
+def get_deleted_variables_impact(file_path, old_graph, full_project_graph, session=None):
     """
     Compare old graph with current file to find deleted variables/functions.
     Returns (deleted_vars, deleted_funcs, affected_by_deletion)
     """
-    new_graph = build_full_graph_for_file(file_path)
+    session = session or AnalysisSession(file_path)
+    new_graph = session.graph
     
     old_vars = set(old_graph.get("variables", {}).keys())
     new_vars = set(new_graph.get("variables", {}).keys())
@@ -328,49 +652,9 @@ def get_deleted_variables_impact(file_path, old_graph, full_project_graph):
     deleted_vars = old_vars - new_vars
     deleted_funcs = old_funcs - new_funcs
     
-    # Find all variables/functions that depended on deleted items
-    affected_by_deletion = set()
-    
-    def normalize(name):
-        parts = name.split(".")
-        if len(parts) > 2:
-            return f"{parts[0]}.{parts[-1]}"
-        return name
-    
-    # Check current graph for dependencies on deleted items
-    for var, info in new_graph.get("variables", {}).items():
-        for dep in info.get("depends_on", []):
-            if normalize(dep) in {normalize(d) for d in deleted_vars | deleted_funcs}:
-                affected_by_deletion.add(var)
-    
-    for func, info in new_graph.get("functions", {}).items():
-        for dep in info.get("depends_on", []):
-            if normalize(dep) in {normalize(d) for d in deleted_vars | deleted_funcs}:
-                affected_by_deletion.add(func)
-    
-    # Recursively expand to find second-level impacts
-    def expand_deletion_impact():
-        changed = True
-        normalized_affected = {normalize(a) for a in affected_by_deletion}
-        
-        while changed:
-            changed = False
-            for var, info in new_graph.get("variables", {}).items():
-                deps = {normalize(d) for d in info.get("depends_on", [])}
-                if any(d in normalized_affected for d in deps):
-                    if var not in affected_by_deletion:
-                        affected_by_deletion.add(var)
-                        normalized_affected.add(normalize(var))
-                        changed = True
-            
-            for func, info in new_graph.get("functions", {}).items():
-                deps = {normalize(d) for d in info.get("depends_on", [])}
-                if any(d in normalized_affected for d in deps):
-                    if func not in affected_by_deletion:
-                        affected_by_deletion.add(func)
-                        normalized_affected.add(normalize(func))
-                        changed = True
-    
-    expand_deletion_impact()
+    # Find everything that depends on deleted items, directly or transitively
+    seeds = {normalize_name(d) for d in deleted_vars | deleted_funcs}
+    impacted_vars, impacted_funcs = session.propagator.propagate(seeds)
+    affected_by_deletion = impacted_vars | impacted_funcs
     
     return deleted_vars, deleted_funcs, affected_by_deletion
\ No newline at end of file
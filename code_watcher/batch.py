@@ -0,0 +1,343 @@
+# batch.py
+"""
+One-shot impact analysis of a git diff range or a patch, for CI.
+
+    python batch.py <project path> --base origin/main --head HEAD
+    python batch.py <project path> --base origin/main             # base vs working tree
+    python batch.py <project path> --patch change.diff            # tree is the patch's base
+    python batch.py <project path> --patch change.diff --applied  # tree already has the patch
+
+Reports added, deleted and modified variables/functions per changed file
+and their downstream impact across the project, as JSON on stdout (or
+--output), then exits. Files outside the diff are read from the working
+tree, so run it in a checkout of the base or head revision.
+
+The project graph is kept in --cache-dir (a temporary folder by default);
+point it at a directory your CI caches to reuse unchanged files' graphs
+between runs. The watcher's line cache and graph cache are never touched.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+from analyzer import (
+    AnalysisSession,
+    analyze_project,
+    analyze_file_changes,
+    get_added_variables,
+    get_deleted_variables_impact,
+    split_lines
+)
+from cache_manager import CacheManager, compare_lines
+from timing import EventTimer
+
+
+class BatchError(Exception):
+    """Raised when the revisions or the patch cannot be read."""
+
+
+# -----------------------------
+# Changed files from git
+# -----------------------------
+def git(project_path, *args):
+    result = subprocess.run(["git", *args], cwd=project_path, capture_output=True)
+    if result.returncode != 0:
+        raise BatchError(f"git {' '.join(args)}: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+
+def changes_from_git(project_path, base, head=None):
+    """
+    Python files changed between base and head (the working tree if None),
+    as {relative_path: (old_text, new_text)}; None marks a missing side.
+    """
+    args = ["diff", "--relative", "--no-renames", "--name-status", "-z", base]
+    fields = git(project_path, *args, *([head] if head else []), "--", "*.py").decode("utf-8").split("\0")
+
+    def read(rev, path):
+        if rev is None:
+            with open(os.path.join(project_path, path), "r", encoding="utf-8") as f:
+                return f.read()
+        return git(project_path, "show", f"{rev}:./{path}").decode("utf-8")
+
+    changes = {}
+    for status, path in zip(fields[0::2], fields[1::2]):
+        old_text = None if status == "A" else read(base, path)
+        new_text = None if status == "D" else read(head, path)
+        changes[path] = (old_text, new_text)
+    return changes
+
+
+# -----------------------------
+# Changed files from a patch
+# -----------------------------
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_patch(text):
+    """
+    Parse a unified diff. Returns [(old_path, new_path, hunks)] with paths
+    stripped of their a/ b/ prefixes (None for /dev/null) and hunks as
+    [(old_start, new_start, lines)], lines keeping their " ", "-", "+" marker.
+    """
+    def strip_path(header):
+        path = header.split("\t")[0].strip()
+        if path == "/dev/null":
+            return None
+        return path[2:] if path[:2] in ("a/", "b/") else path
+
+    files = []
+    lines = split_lines(text)
+    i = 0
+    while i < len(lines):
+        if lines[i].startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            hunks = []
+            files.append((strip_path(lines[i][4:]), strip_path(lines[i + 1][4:]), hunks))
+            i += 2
+            continue
+        match = HUNK_HEADER.match(lines[i])
+        if match and files:
+            old_start, old_count, new_start, new_count = (
+                int(g) if g is not None else 1 for g in match.groups()
+            )
+            hunk_lines = []
+            i += 1
+            while i < len(lines) and (old_count > 0 or new_count > 0 or lines[i].startswith("\\")):
+                line = lines[i]
+                if line.startswith("\\"):  # "\ No newline at end of file"
+                    if hunk_lines:
+                        hunk_lines[-1] = hunk_lines[-1].rstrip("\r\n")
+                else:
+                    marker = line[:1] if line[:1] in ("-", "+") else " "
+                    old_count -= marker != "+"
+                    new_count -= marker != "-"
+                    hunk_lines.append(marker + (line[1:] if line[:1] in (" ", "-", "+") else "\n"))
+                i += 1
+            files[-1][2].append((old_start, new_start, hunk_lines))
+            continue
+        i += 1
+    return files
+
+
+def apply_hunks(old_text, hunks, reverse=False):
+    """Apply parsed hunks to old_text (or undo them with reverse=True)."""
+    take, drop = ("+", "-") if reverse else ("-", "+")
+    old_lines = split_lines(old_text or "")
+    new_lines, pos = [], 0
+    for old_start, new_start, hunk_lines in hunks:
+        start = (new_start if reverse else old_start) - 1
+        # A hunk that only adds lines gives the line it follows; an empty side starts at 0
+        if not any(line[0] in (" ", take) for line in hunk_lines):
+            start += 1
+        new_lines += old_lines[pos:start]
+        pos = start
+        for line in hunk_lines:
+            marker, content = line[0], line[1:]
+            if marker in (" ", take):
+                if pos >= len(old_lines) or old_lines[pos].rstrip("\r\n") != content.rstrip("\r\n"):
+                    raise BatchError(f"patch does not apply at line {pos + 1}")
+                pos += 1
+            if marker in (" ", drop):
+                new_lines.append(content)
+    new_lines += old_lines[pos:]
+    return "".join(new_lines)
+
+
+def changes_from_patch(project_path, patch_text, applied=False):
+    """
+    Python files changed by a patch, as {relative_path: (old_text, new_text)}.
+    The tree holds the old side, or the new side if applied is True.
+    """
+    changes = {}
+    for old_path, new_path, hunks in parse_patch(patch_text):
+        tree_path = new_path if applied else old_path
+        path = new_path or old_path
+        if not path.endswith(".py"):
+            continue
+        tree_text = None
+        if tree_path is not None:
+            try:
+                with open(os.path.join(project_path, tree_path), "r", encoding="utf-8") as f:
+                    tree_text = f.read()
+            except OSError as e:
+                raise BatchError(f"cannot read {tree_path}: {e}")
+        other_text = apply_hunks(tree_text, hunks, reverse=applied)
+        old_text, new_text = (other_text, tree_text) if applied else (tree_text, other_text)
+        if old_path is None:
+            old_text = None
+        if new_path is None:
+            new_text = None
+        if old_path is not None and new_path is not None and old_path != new_path:
+            changes[old_path] = (old_text, None)
+            changes[new_path] = (None, new_text)
+        else:
+            changes[path] = (old_text, new_text)
+    return changes
+
+
+# -----------------------------
+# Impact analysis
+# -----------------------------
+def analyze_changes(project_path, changes, cache_dir, workers=1, timer=None):
+    """
+    Analyze {relative_path: (old_text, new_text)} against the project's
+    dependency graph. Returns the JSON-ready report.
+    """
+    timer = timer or EventTimer(project_path, phase="batch")
+    cache = CacheManager(cache_dir)
+    try:
+        # Project graph at the new side: the working tree, with the changed files replaced
+        with timer.span("scan"):
+            fingerprints = cache.load_fingerprints()
+            scan_stats = {}
+            graph = analyze_project(project_path, cache.load_graph(), fingerprints,
+                                    workers=workers, stats=scan_stats)
+
+        files = []
+        sessions = {}
+        with timer.span("parse"):
+            for rel_path, (old_text, new_text) in sorted(changes.items()):
+                file_path = os.path.join(project_path, *rel_path.split("/"))
+                old_graph = AnalysisSession(file_path, code=old_text).graph if old_text is not None \
+                    else {"variables": {}, "functions": {}}
+                session = AnalysisSession(file_path, code=new_text or "")
+                sessions[file_path] = (rel_path, old_text, new_text, old_graph, session)
+                if new_text is None:
+                    graph.pop(file_path, None)
+                else:
+                    graph[file_path] = session.graph
+                # The cached graph must describe the working tree for the next run
+                if graph.get(file_path) is not None and not _tree_matches(file_path, new_text):
+                    fingerprints.pop(file_path, None)
+            cache.save_graph(graph)
+            cache.save_fingerprints(fingerprints)
+
+        for file_path, (rel_path, old_text, new_text, old_graph, session) in sessions.items():
+            with timer.span("analyze"):
+                old_lines = split_lines(old_text or "")
+                changed_lines, is_reorder_only, reorder_scope, hunks = compare_lines(old_lines, session.lines)
+                added_vars, added_funcs = get_added_variables(file_path, old_graph, session=session)
+                deleted_vars, deleted_funcs, affected_by_deletion = get_deleted_variables_impact(
+                    file_path, old_graph, graph, session=session
+                )
+                if is_reorder_only:
+                    affected_vars, affected_funcs = set(), set()
+                else:
+                    affected_vars, affected_funcs = analyze_file_changes(file_path, changed_lines, session=session)
+                affected_vars -= added_vars
+                affected_funcs -= added_funcs
+
+            with timer.span("propagate"):
+                new_graph = session.graph
+                seed_vars = affected_vars | deleted_vars | {
+                    name for name in affected_by_deletion if name in new_graph["variables"]
+                }
+                seed_funcs = affected_funcs | deleted_funcs | {
+                    name for name in affected_by_deletion if name in new_graph["functions"]
+                }
+                # Sorted seeds keep the report stable across runs
+                downstream_vars, downstream_funcs = cache.get_ordered_recursive_affected(
+                    sorted(seed_vars), sorted(seed_funcs)
+                )
+
+            files.append({
+                "file": rel_path,
+                "status": "added" if old_text is None else "deleted" if new_text is None else "modified",
+                "changed_lines": changed_lines,
+                "deleted_lines": [
+                    line_num
+                    for hunk in hunks if hunk["type"] == "delete"
+                    for line_num in range(hunk["old_start"], hunk["old_start"] + hunk["old_count"])
+                ],
+                "reorder_only": reorder_scope if is_reorder_only else None,
+                "added": {"variables": sorted(added_vars), "functions": sorted(added_funcs)},
+                "deleted": {"variables": sorted(deleted_vars), "functions": sorted(deleted_funcs)},
+                "modified": {"variables": sorted(affected_vars), "functions": sorted(affected_funcs)},
+                "affected_by_deletion": sorted(affected_by_deletion),
+                "downstream": {"variables": downstream_vars, "functions": downstream_funcs},
+            })
+    finally:
+        cache.close()
+
+    record = timer.record("analyzed")
+    return {
+        "project": project_path,
+        "files": files,
+        "summary": {
+            "files": len(files),
+            "added": sum(len(f["added"]["variables"]) + len(f["added"]["functions"]) for f in files),
+            "deleted": sum(len(f["deleted"]["variables"]) + len(f["deleted"]["functions"]) for f in files),
+            "modified": sum(len(f["modified"]["variables"]) + len(f["modified"]["functions"]) for f in files),
+            "downstream": len({name for f in files for kind in ("variables", "functions")
+                               for name in f["downstream"][kind]}),
+        },
+        "scan": scan_stats,
+        "timing_ms": dict(record["stages_ms"], total=record["total_ms"]),
+    }
+
+
+def _tree_matches(file_path, text):
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read() == text
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Impact analysis of a git diff range or a patch, as JSON")
+    parser.add_argument("project", help="project folder (inside the git repository for --base)")
+    parser.add_argument("--base", help="base revision")
+    parser.add_argument("--head", help="head revision (default: the working tree)")
+    parser.add_argument("--patch", help="unified diff file, '-' for stdin")
+    parser.add_argument("--applied", action="store_true", help="the working tree already contains the patch")
+    parser.add_argument("--cache-dir", help="keep the project graph cache here between runs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="process pool size for the project scan")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if bool(args.base) == bool(args.patch):
+        parser.error("give either --base [--head] or --patch")
+
+    project_path = os.path.abspath(args.project)
+    try:
+        # Progress messages go to stderr so stdout is only the report
+        with contextlib.redirect_stdout(sys.stderr):
+            timer = EventTimer(project_path, phase="batch")
+            with timer.span("diff"):
+                if args.patch:
+                    if args.patch == "-":
+                        patch_text = sys.stdin.read()
+                    else:
+                        with open(args.patch, "r", encoding="utf-8") as f:
+                            patch_text = f.read()
+                    changes = changes_from_patch(project_path, patch_text, args.applied)
+                else:
+                    changes = changes_from_git(project_path, args.base, args.head)
+
+            with contextlib.nullcontext(args.cache_dir) if args.cache_dir else \
+                    tempfile.TemporaryDirectory(prefix="code_watcher_batch_") as cache_dir:
+                report = analyze_changes(project_path, changes, cache_dir, workers=args.workers, timer=timer)
+    except (BatchError, OSError, UnicodeDecodeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    report.update(base=args.base, head=args.head, patch=args.patch)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"📝 Impact report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
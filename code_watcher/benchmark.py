@@ -0,0 +1,307 @@
+# benchmark.py
+"""
+Benchmarks for the watcher pipeline on a generated project.
+
+    python benchmark.py --files 200 --functions 10 --depth 2 --fanout 3
+
+Times the startup scan (cold and with cached fingerprints), the baseline
+preload, and per-save work on random edits: get_changed_lines,
+analyze_file_changes, get_ordered_recursive_affected and a full
+handle_change. Reports p50/p95 per stage and the process's peak RSS.
+Use --json to save the results for comparison between versions.
+
+It also measures how long a fresh interpreter takes to import main (with
+-X importtime); --import-budget <ms> makes the run fail when the import
+exceeds the budget, e.g. as a CI check.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from analyzer import AnalysisSession, analyze_project, analyze_file_changes
+from cache_manager import CacheManager
+from timing import EventTimer
+
+
+# -----------------------------
+# Synthetic project generator
+# -----------------------------
+def generate_project(root, files=50, functions=10, depth=2, fanout=3, seed=0):
+    """
+    Write files modules of functions top-level functions each. Every
+    function nests depth levels of inner functions, and every assignment
+    depends on fanout names drawn from the whole project, so changes
+    propagate across files. Returns the list of generated file paths.
+    """
+    rng = random.Random(seed)
+    variables = [f"value_{m}_{i}" for m in range(files) for i in range(functions)]
+    function_names = [f"func_{m}_{i}" for m in range(files) for i in range(functions)]
+
+    def deps(pool):
+        return " + ".join(rng.sample(pool, min(fanout, len(pool)))) or "0"
+
+    def emit_function(lines, name, level, indent):
+        pad = "    " * indent
+        lines.append(f"{pad}def {name}(arg):")
+        lines.append(f"{pad}    local_{level} = arg + {deps(variables)} + 1")
+        if level < depth:
+            emit_function(lines, f"inner_{level + 1}", level + 1, indent + 1)
+            lines.append(f"{pad}    local_{level} = inner_{level + 1}(local_{level})")
+        calls = " + ".join(f"{f}(local_{level})" for f in rng.sample(function_names, min(fanout, len(function_names))))
+        lines.append(f"{pad}    result = {calls}")
+        lines.append(f"{pad}    return result")
+
+    paths = []
+    os.makedirs(root, exist_ok=True)
+    for m in range(files):
+        package = os.path.join(root, f"pkg_{m % 10}")
+        os.makedirs(package, exist_ok=True)
+        lines = []
+        for i in range(functions):
+            lines.append(f"value_{m}_{i} = {deps(variables[:m * functions + i])} + {i}")
+        for i in range(functions):
+            lines.append("")
+            emit_function(lines, f"func_{m}_{i}", 1, 0)
+        path = os.path.join(package, f"module_{m}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def edit_file(path, rng):
+    """Change the constant of one assignment and insert a new one after it, like a small save."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    i = rng.choice([i for i, line in enumerate(lines) if " = " in line and line.rstrip()[-1:].isdigit()])
+    line = lines[i].rstrip()
+    indent = line[:len(line) - len(line.lstrip())]
+    lines[i] = line[:-1] + str((int(line[-1]) + 1) % 10) + "\n"
+    lines.insert(i + 1, f"{indent}extra_{rng.randint(0, 10 ** 6)} = value_0_0 + 1\n")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its children, in MB (None if unavailable)."""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # bytes on macOS, KB elsewhere
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * scale / (1024 * 1024)
+
+
+class Stages:
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        return {
+            stage: {
+                "runs": len(samples),
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "max_ms": max(samples) * 1000,
+            }
+            for stage, samples in self.samples.items()
+        }
+
+
+def load_process_change():
+    """main's handle_change body; without a claude_analyzer it skips the Claude stage."""
+    try:
+        from main import process_change
+    except ImportError as e:
+        print(f"⚠️  Skipping handle_change benchmark, main.py could not be imported: {e}")
+        return None
+    return process_change
+
+
+def measure_import_time(module="main", runs=5):
+    """
+    Import module in fresh interpreters with -X importtime. Returns the
+    best cumulative import time in ms and the slowest imports of that run
+    as [(ms, name)], or (None, []) if the import fails.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best, slowest = None, []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=here, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"⚠️  Could not import {module}: {result.stderr.strip().splitlines()[-1:]}")
+            return None, []
+        # A module's line follows its children's, which are indented two more spaces
+        total, children = None, []
+        for line in result.stderr.splitlines():
+            fields = line[len("import time:"):].split("|")
+            if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            ms, name = int(fields[1]) / 1000, fields[2].rstrip()
+            indent = len(name) - len(name.lstrip())
+            if indent == 1:
+                if name.strip() == module:
+                    total = ms
+                    break
+                children = []
+            elif indent == 3:
+                children.append((ms, name.strip()))
+        if total is not None and (best is None or total < best):
+            best, slowest = total, sorted(children, reverse=True)[:5]
+    return best, slowest
+
+
+def run(args):
+    root = tempfile.mkdtemp(prefix="code_watcher_bench_")
+    project = os.path.join(root, "project")
+    stages = Stages()
+    rng = random.Random(args.seed)
+    quiet = open(os.devnull, "w")
+    try:
+        paths = generate_project(project, args.files, args.functions, args.depth, args.fanout, args.seed)
+        lines = 0
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                lines += sum(1 for _ in f)
+        print(f"📁 Generated {len(paths)} files, {lines} lines in {project}")
+
+        # Startup: cold scan, then a warm scan that reuses the cached graph
+        with contextlib.redirect_stdout(quiet):
+            for _ in range(args.repeat):
+                with stages.time("analyze_project (cold)"):
+                    analyze_project(project, workers=args.workers)
+            cache = CacheManager(project)
+            fingerprints = cache.load_fingerprints()
+            graph = analyze_project(project, None, fingerprints, workers=args.workers)
+            cache.save_graph(graph)
+            cache.save_fingerprints(fingerprints)
+            cache.flush()
+            for _ in range(args.repeat):
+                with stages.time("analyze_project (warm)"):
+                    analyze_project(project, None, cache.load_fingerprints(), workers=args.workers,
+                                    changed_only=True)
+            for _ in range(args.repeat):
+                with stages.time("preload baselines"):
+                    cache.preload_baselines(project)
+                    cache.flush()
+
+        # Per-save work on random edits
+        process_change = load_process_change()
+        output = io.StringIO()
+        for _ in range(args.iterations):
+            path = rng.choice(paths)
+            edit_file(path, rng)
+            with contextlib.redirect_stdout(quiet):
+                with stages.time("get_changed_lines"):
+                    session = AnalysisSession(path)
+                    changed_lines = cache.get_changed_lines(path, session.lines)[0]
+                with stages.time("analyze_file_changes"):
+                    affected_vars, affected_funcs = analyze_file_changes(path, changed_lines, session=session)
+                with stages.time("get_ordered_recursive_affected"):
+                    cache.get_ordered_recursive_affected(affected_vars, affected_funcs)
+                if process_change is not None:
+                    timer = EventTimer(path)
+                    with stages.time("handle_change"):
+                        process_change(path, cache, output, timer)
+                    for stage, seconds in timer.stages.items():
+                        stages.samples.setdefault(f"  handle_change: {stage}", []).append(seconds)
+                else:
+                    cache.update_file_baseline(path, session.lines)
+        cache.close()
+    finally:
+        quiet.close()
+        if args.keep:
+            print(f"📁 Kept benchmark project in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    import_ms, slowest_imports = measure_import_time("main")
+    return {
+        "params": vars(args),
+        "stages": stages.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "import_main_ms": import_ms,
+        "slowest_imports": slowest_imports,
+    }
+
+
+def print_report(results):
+    print(f"\n{'stage':<34}{'runs':>6}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    print("-" * 76)
+    for stage, s in results["stages"].items():
+        print(f"{stage:<34}{s['runs']:>6}{s['p50_ms']:>12.2f}{s['p95_ms']:>12.2f}{s['max_ms']:>12.2f}")
+    rss = results["peak_rss_mb"]
+    print(f"\nPeak RSS: {rss:.1f} MB" if rss is not None else "\nPeak RSS: n/a on this platform")
+    if results["import_main_ms"] is not None:
+        print(f"import main: {results['import_main_ms']:.1f} ms (best of 5 fresh interpreters)")
+        for ms, name in results["slowest_imports"]:
+            print(f"   {name:<30}{ms:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the code watcher on a synthetic project")
+    parser.add_argument("--files", type=int, default=100, help="modules to generate")
+    parser.add_argument("--functions", type=int, default=10, help="top-level functions (and variables) per module")
+    parser.add_argument("--depth", type=int, default=2, help="nesting depth of inner functions")
+    parser.add_argument("--fanout", type=int, default=3, help="dependencies per assignment and calls per function")
+    parser.add_argument("--iterations", type=int, default=30, help="random edits for the per-save stages")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each startup stage")
+    parser.add_argument("--workers", type=int, default=1, help="analyze_project process pool size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated project")
+    parser.add_argument("--import-budget", type=float,
+                        help="fail (exit 1) if importing main takes longer than this many ms")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📝 Results written to {args.json}")
+    if args.import_budget is not None:
+        if results["import_main_ms"] is None or results["import_main_ms"] > args.import_budget:
+            print(f"❌ import main is over the {args.import_budget:.0f} ms budget")
+            return 1
+        print(f"✅ import main is within the {args.import_budget:.0f} ms budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
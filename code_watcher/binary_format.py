@@ -0,0 +1,211 @@
+# binary_format.py
+import sys
+import json
+import zlib
+import struct
+from array import array
+
+from symbol_table import KINDS, SymbolTable
+
+# Versioned binary encoding for the graph shards and the line cache.
+#
+#   header   magic "CWB", format version, flags, record type   (6 bytes)
+#   body     length-prefixed sections (u32 length + bytes), optionally zlib'd:
+#              [0] string lengths (u32 array, in characters)
+#              [1] string table (all strings concatenated, UTF-8)
+#              [2:] record-specific u32 arrays of string ids / offsets
+#
+# Every string is stored once and referenced by id, and the arrays are
+# read and written with array.frombytes/tobytes, so no per-value parsing
+# is done in Python. All integers are little-endian.
+
+MAGIC = b"CWB"
+FORMAT_VERSION = 1
+FLAG_ZLIB = 0x01
+
+RECORD_GRAPH = 1
+RECORD_LINE_CACHE = 2
+
+_HEADER = struct.Struct("<3sBBB")
+_LENGTH = struct.Struct("<I")
+
+
+class FormatError(ValueError):
+    """Raised when data is not a readable record of the expected type."""
+
+
+def _to_bytes(values):
+    ints = array("I", values)
+    if sys.byteorder == "big":
+        ints.byteswap()
+    return ints.tobytes()
+
+
+def _from_bytes(data):
+    ints = array("I")
+    ints.frombytes(data)
+    if sys.byteorder == "big":
+        ints.byteswap()
+    return ints
+
+
+def _encode(record_type, strings, arrays, compress=False):
+    sections = [
+        _to_bytes(len(s) for s in strings),
+        "".join(strings).encode("utf-8", "surrogatepass"),
+    ] + [_to_bytes(values) for values in arrays]
+    body = b"".join(_LENGTH.pack(len(section)) + section for section in sections)
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, flags, record_type) + body
+
+
+def _decode(data, record_type):
+    """Return (strings, arrays) of a record, checking its header."""
+    if len(data) < _HEADER.size:
+        raise FormatError("truncated header")
+    magic, version, flags, found_type = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise FormatError("not a code watcher cache file")
+    if version != FORMAT_VERSION:
+        raise FormatError(f"unsupported format version {version}")
+    if found_type != record_type:
+        raise FormatError(f"expected record type {record_type}, found {found_type}")
+
+    body = memoryview(data)[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        try:
+            body = memoryview(zlib.decompress(body))
+        except zlib.error as e:
+            raise FormatError(f"corrupt compressed body: {e}") from e
+
+    sections, pos = [], 0
+    while pos < len(body):
+        if pos + _LENGTH.size > len(body):
+            raise FormatError("truncated section header")
+        (length,) = _LENGTH.unpack_from(body, pos)
+        pos += _LENGTH.size
+        if pos + length > len(body):
+            raise FormatError("truncated section")
+        sections.append(body[pos:pos + length])
+        pos += length
+    if len(sections) < 2:
+        raise FormatError("missing string table")
+
+    try:
+        blob = bytes(sections[1]).decode("utf-8", "surrogatepass")
+    except UnicodeDecodeError as e:
+        raise FormatError(f"corrupt string table: {e}") from e
+    strings, start = [], 0
+    for length in _from_bytes(sections[0]):
+        strings.append(blob[start:start + length])
+        start += length
+    return strings, [_from_bytes(section) for section in sections[2:]]
+
+
+# -----------------------------
+# Graph shards
+# -----------------------------
+#
+# A graph record has three arrays per kind (names, offsets, deps) and, if
+# the file's fingerprint is stored with it, one more array holding the
+# string id of the fingerprint as JSON.
+def encode_graph(file_path, graph, compress=False, fingerprint=None):
+    """Encode one file's {"variables", "functions"} graph and optional fingerprint."""
+    strings = SymbolTable([file_path])
+    arrays = []
+    for kind in KINDS:
+        names, offsets, deps = [], [0], []
+        for name, data in graph.get(kind, {}).items():
+            names.append(strings.intern(name))
+            deps.extend(strings.intern(dep) for dep in data.get("depends_on", []))
+            offsets.append(len(deps))
+        arrays += [names, offsets, deps]
+    if fingerprint:
+        arrays.append([strings.intern(json.dumps(fingerprint, sort_keys=True))])
+    return _encode(RECORD_GRAPH, strings.names, arrays, compress)
+
+
+def _decode_graph_record(data):
+    strings, arrays = _decode(data, RECORD_GRAPH)
+    if not strings or len(arrays) not in (3 * len(KINDS), 3 * len(KINDS) + 1):
+        raise FormatError("malformed graph record")
+    return strings, arrays
+
+
+def decode_graph_fingerprint(data):
+    """Return (file_path, fingerprint or None) without building the graph."""
+    strings, arrays = _decode_graph_record(data)
+    if len(arrays) == 3 * len(KINDS):
+        return strings[0], None
+    try:
+        return strings[0], json.loads(strings[arrays[-1][0]])
+    except (IndexError, ValueError) as e:
+        raise FormatError("malformed graph fingerprint") from e
+
+
+def decode_graph(data):
+    """Return (file_path, graph) from an encoded graph shard."""
+    strings, arrays = _decode_graph_record(data)
+    graph = {}
+    try:
+        for index, kind in enumerate(KINDS):
+            names, offsets, deps = arrays[3 * index:3 * index + 3]
+            graph[kind] = {
+                strings[name]: {"depends_on": [strings[dep] for dep in deps[offsets[i]:offsets[i + 1]]]}
+                for i, name in enumerate(names)
+            }
+    except IndexError as e:
+        raise FormatError("malformed graph record") from e
+    return strings[0], graph
+
+
+# -----------------------------
+# Line cache
+# -----------------------------
+def encode_line_cache(line_cache, compress=False):
+    """Encode {file_path: [line, ...]}; identical lines are stored once."""
+    strings = SymbolTable()
+    files, offsets, lines = [], [0], []
+    for file_path, file_lines in line_cache.items():
+        files.append(strings.intern(file_path))
+        lines.extend(strings.intern(line) for line in file_lines)
+        offsets.append(len(lines))
+    return _encode(RECORD_LINE_CACHE, strings.names, [files, offsets, lines], compress)
+
+
+def decode_line_cache(data):
+    strings, arrays = _decode(data, RECORD_LINE_CACHE)
+    if len(arrays) != 3:
+        raise FormatError("malformed line cache record")
+    files, offsets, lines = arrays
+    try:
+        return {
+            strings[file_id]: [strings[line] for line in lines[offsets[i]:offsets[i + 1]]]
+            for i, file_id in enumerate(files)
+        }
+    except IndexError as e:
+        raise FormatError("malformed line cache record") from e
+
+
+# -----------------------------
+# JSON debug export
+# -----------------------------
+def to_json(data):
+    """Decode any cache record to a JSON-compatible object."""
+    if len(data) >= _HEADER.size and _HEADER.unpack_from(data)[3] == RECORD_GRAPH:
+        file_path, graph = decode_graph(data)
+        return {"file_path": file_path, "fingerprint": decode_graph_fingerprint(data)[1], "graph": graph}
+    return decode_line_cache(data)
+
+
+if __name__ == "__main__":
+    # python binary_format.py <file.bin>  ->  JSON on stdout
+    if len(sys.argv) != 2:
+        print("Usage: python binary_format.py <cache file>")
+        sys.exit(1)
+    with open(sys.argv[1], "rb") as f:
+        json.dump(to_json(f.read()), sys.stdout, indent=2)
+    print()
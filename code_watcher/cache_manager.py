@@ -1,116 +1,517 @@
 import os
 import json
 import time
+import difflib
+import threading
+from contextlib import nullcontext
+from graph_store import ShardedGraphStore
+from binary_format import encode_line_cache, decode_line_cache
+from symbol_table import CompiledGraph
+from snapshot import GraphSnapshot, write_snapshot
+
+# Files updated since the reverse-dependency index was compiled are kept in
+# a dict overlay; past this many the index is recompiled.
+COMPILE_OVERLAY_LIMIT = 64
+
+def diff_lines(old_lines, new_lines):
+    """
+    Line diff of two versions (ignoring surrounding whitespace).
+    Returns hunks: [{"type": "insert" | "delete" | "modify",
+                     "old_start", "old_count", "new_start", "new_count"}]
+    with 1-based line numbers. A deletion's new_start is the line that now
+    follows the removed block.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [line.strip() for line in old_lines], [line.strip() for line in new_lines],
+        autojunk=False
+    )
+    hunk_types = {"insert": "insert", "delete": "delete", "replace": "modify"}
+    return [
+        {
+            "type": hunk_types[tag],
+            "old_start": i1 + 1,
+            "old_count": i2 - i1,
+            "new_start": j1 + 1,
+            "new_count": j2 - j1,
+        }
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def compare_lines(old_lines, current_lines):
+    """
+    Compare two versions of a file.
+    Returns (changed_lines, is_reorder_only, reorder_scope, hunks); see
+    CacheManager.get_changed_lines, which compares against the line cache.
+    """
+    hunks = diff_lines(old_lines, current_lines)
+    changed = [
+        line_num
+        for hunk in hunks
+        for line_num in range(hunk["new_start"], hunk["new_start"] + hunk["new_count"])
+    ]
+
+    # Check if it's just a reordering
+    is_reorder_only = False
+    reorder_scope = None
+    
+    if hunks and len(current_lines) == len(old_lines):
+        # Get sorted content of both versions
+        old_content_sorted = sorted([line.strip() for line in old_lines if line.strip()])
+        new_content_sorted = sorted([line.strip() for line in current_lines if line.strip()])
+        
+        # If sorted content is identical, it's just reordering
+        if old_content_sorted == new_content_sorted:
+            is_reorder_only = True
+            reorder_scope = "file"
+    
+    # Check for local reordering: the changed hunks only move lines around
+    if hunks and not is_reorder_only:
+        old_range, new_range = [], []
+        for hunk in hunks:
+            old_range += old_lines[hunk["old_start"] - 1:hunk["old_start"] - 1 + hunk["old_count"]]
+            new_range += current_lines[hunk["new_start"] - 1:hunk["new_start"] - 1 + hunk["new_count"]]
+
+        old_sorted = sorted(line.strip() for line in old_range if line.strip())
+        new_sorted = sorted(line.strip() for line in new_range if line.strip())
+        if old_sorted and old_sorted == new_sorted:
+            is_reorder_only = True
+            reorder_scope = "local"
+
+    return changed, is_reorder_only, reorder_scope, hunks
+
+
+def short_name(name):
+    """Unqualified name: test1.fn.var -> var"""
+    return name.rsplit(".", 1)[-1]
+
 
 class CacheManager:
-    def __init__(self, project_path):
+    def __init__(self, project_path, compress=False, backend="shards", metrics=None):
         self.project_path = project_path
-        self.graph_file = os.path.join(project_path, "graph_cache.json")
-        self.line_cache_file = os.path.join(project_path, "line_cache.json")
+        self.compress = compress
+        self.metrics = metrics  # optional metrics.MetricsRegistry for cache I/O timings
+        self.graph_dir = os.path.join(project_path, "graph_cache")
+        self.line_cache_file = os.path.join(project_path, "line_cache.bin")
+        self.snapshot_file = os.path.join(self.graph_dir, "graph.snapshot")
+        if backend == "shards":
+            self.store = ShardedGraphStore(self.graph_dir, compress=compress)
+        elif backend == "sqlite":
+            from sqlite_store import SQLiteGraphStore
+            self.store = SQLiteGraphStore(os.path.join(self.graph_dir, "graph.sqlite3"))
+        else:
+            raise ValueError(f"Unknown graph cache backend: {backend!r}")
         self.line_cache = {}
         self.load_line_cache()
+        # Reverse-dependency index, the only in-memory form of the whole
+        # graph: a CompiledGraph of the graph cache (or a current mmap'ed
+        # GraphSnapshot of it) plus an overlay
+        # (kind -> key -> {file_path: {dependent_name: None}}) for files
+        # updated since it was compiled, which shadow their old nodes.
+        # It is built from the store on first use; load_graph() and
+        # export_json() produce the dict view on demand.
+        # A store with its own indexes (SQLite) answers queries itself
+        # instead: then no CompiledGraph is built, and the overlay holds the
+        # unflushed files, which are excluded from the store's answers.
+        self._store_index = hasattr(self.store, "dependents")
+        self._compiled = None
+        self._snapshot_checked = False
+        self._shadowed_files = set()   # compiled file symbols replaced or removed since the compile
+        self._overlay_files = {}       # file_path -> graph indexed in the overlay
+        self._dependents_by_short = {"variables": {}, "functions": {}} if self._store_index else None
+        self._dependents_by_name = {"variables": {}, "functions": {}} if self._store_index else None
+        # Write-behind persistence: the store plus these is the whole graph
+        self._pending = {}             # file_path -> graph changed since the last flush
+        self._removed_files = set()
+        self._fingerprints = None
+        self._fingerprint_updates = {}  # file_path -> fingerprint or None, not yet in the store
+        self._line_cache_dirty = False
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
 
     # -----------------------------
     # Line cache
     # -----------------------------
     def load_line_cache(self):
         if os.path.exists(self.line_cache_file):
-            with open(self.line_cache_file, "r", encoding="utf-8") as f:
+            with open(self.line_cache_file, "rb") as f:
                 try:
-                    self.line_cache = json.load(f)
-                except json.JSONDecodeError:
+                    self.line_cache = decode_line_cache(f.read())
+                except ValueError:
                     self.line_cache = {}
 
-    def save_line_cache(self):
+    def save_line_cache(self, line_cache=None):
         os.makedirs(os.path.dirname(self.line_cache_file), exist_ok=True)
-        with open(self.line_cache_file, "w", encoding="utf-8") as f:
-            json.dump(self.line_cache, f, indent=2)
+        data = encode_line_cache(self.line_cache if line_cache is None else line_cache, self.compress)
+        tmp_file = self.line_cache_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, self.line_cache_file)
 
-    def get_changed_lines(self, file_path):
+    def export_json(self, directory):
+        """Debug export: write graph_cache.json and line_cache.json into directory."""
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            graph = self.load_graph()
+            line_cache = dict(self.line_cache)
+        for name, obj in (("graph_cache.json", graph), ("line_cache.json", line_cache)):
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                json.dump(obj, f, indent=2, default=list)
+
+    def get_changed_lines(self, file_path, current_lines=None):
         """Compare file with cached version and return changed line numbers.
-        Returns (changed_lines, current_lines, is_reorder_only, reorder_scope) 
+        Returns (changed_lines, current_lines, is_reorder_only, reorder_scope, hunks)
         where reorder_scope indicates if reordering is within a function.
+        changed_lines are the inserted or modified lines in the new numbering;
+        hunks (see diff_lines) also describe pure deletions.
+        Pass current_lines when the file has already been read this event.
         """
-        if not os.path.exists(file_path):
-            return [], [], False, None
+        if current_lines is None:
+            if not os.path.exists(file_path):
+                return [], [], False, None, []
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            current_lines = f.readlines()
+            with open(file_path, "r", encoding="utf-8") as f:
+                current_lines = f.readlines()
 
         old_lines = self.line_cache.get(file_path, [])
-        changed = []
-
-        # Detect changed or new lines
-        for i, line in enumerate(current_lines):
-            if i >= len(old_lines) or line.strip() != old_lines[i].strip():
-                changed.append(i + 1)
-
-        # Check if it's just a reordering
-        is_reorder_only = False
-        reorder_scope = None
-        
-        if changed and len(current_lines) == len(old_lines):
-            # Get sorted content of both versions
-            old_content_sorted = sorted([line.strip() for line in old_lines if line.strip()])
-            new_content_sorted = sorted([line.strip() for line in current_lines if line.strip()])
-            
-            # If sorted content is identical, it's just reordering
-            if old_content_sorted == new_content_sorted:
-                is_reorder_only = True
-                reorder_scope = "file"
-        
-        # Check for local reordering within a specific range (like within a function)
-        if changed and not is_reorder_only:
-            # Check if only a contiguous block changed
-            if changed:
-                min_line = min(changed)
-                max_line = max(changed)
-                
-                # Get the content of the changed range
-                old_range = [old_lines[i-1].strip() for i in range(min_line, min(max_line+1, len(old_lines)+1))]
-                new_range = [current_lines[i-1].strip() for i in range(min_line, min(max_line+1, len(current_lines)+1))]
-                
-                # If the sorted content within the range is the same, it's local reordering
-                if sorted([line for line in old_range if line]) == sorted([line for line in new_range if line]):
-                    is_reorder_only = True
-                    reorder_scope = "local"
-
-        return changed, current_lines, is_reorder_only, reorder_scope
+        changed, is_reorder_only, reorder_scope, hunks = compare_lines(old_lines, current_lines)
+        return changed, current_lines, is_reorder_only, reorder_scope, hunks
 
     # -----------------------------
     # Graph cache
     # -----------------------------
+    # The store under graph_cache/ is written behind the in-memory changes
+    # by flush(), either from the background flusher or on close(). Only
+    # changed files are rewritten.
     def save_graph(self, graph):
-        """Save the dependency graph safely (convert sets to lists)."""
-        os.makedirs(os.path.dirname(self.graph_file), exist_ok=True)
-
-        def convert(obj):
-            if isinstance(obj, set):
-                return list(obj)
-            if isinstance(obj, dict):
-                return {k: convert(v) for k, v in obj.items()}
-            if isinstance(obj, list):
-                return [convert(i) for i in obj]
-            return obj
-
-        safe_graph = convert(graph)
-        with open(self.graph_file, "w", encoding="utf-8") as f:
-            json.dump(safe_graph, f, indent=2)
+        """
+        Replace the whole dependency graph and compile the index from it
+        (unless the store has its own); changed files are persisted on the
+        next flush.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            current = self.load_graph()
+            changed = {f: g for f, g in graph.items() if current.get(f) != g}
+            removed = set(current) - set(graph)
+            if self._store_index:
+                self._update_graph(changed, removed)
+            else:
+                self._compiled = None
+                self._update_graph(changed, removed)
+                self._reset_index(CompiledGraph.from_graph(graph))
+        self._observe_io("save", start)
+
+    def update_graph(self, changed, removed=()):
+        """Replace the graphs of changed ({file_path: graph}) files and drop removed files."""
+        with self._lock:
+            self._update_graph(changed, removed)
+
+    def _update_graph(self, changed, removed):
+        removed = set(removed) - set(changed)
+        self._pending.update(changed)
+        for file_path in removed:
+            self._pending.pop(file_path, None)
+        self._removed_files = (self._removed_files - set(changed)) | removed
+        self._update_index(changed, removed)
 
     def load_graph(self):
-        """Load graph from cache."""
-        if os.path.exists(self.graph_file):
-            with open(self.graph_file, "r", encoding="utf-8") as f:
-                try:
-                    return json.load(f)
-                except json.JSONDecodeError:
-                    return {}
-        return {}
+        """Return the whole graph as a new {file_path: graph} dict (not kept in memory)."""
+        with self._lock:
+            if self._compiled is not None:
+                return self._index_graph()
+            return self._read_graph()
+
+    def _read_graph(self):
+        """The stored graph with the unflushed changes applied."""
+        start = time.perf_counter()
+        graph = self.store.read_all()
+        for file_path in self._removed_files:
+            graph.pop(file_path, None)
+        graph.update(self._pending)
+        self._observe_io("load", start)
+        return graph
+
+    def file_paths(self):
+        with self._lock:
+            return [f for f in self.store.file_paths()
+                    if f not in self._removed_files and f not in self._pending] + list(self._pending)
 
     def get_file_graph(self, file_path):
-        """Get the cached graph for a specific file."""
-        graph = self.load_graph()
-        return graph.get(file_path, {"variables": {}, "functions": {}})
+        """Get the graph for a specific file, reading at most its shard."""
+        with self._lock:
+            file_graph = self._pending.get(file_path) or self._overlay_files.get(file_path)
+            if file_graph is None and file_path not in self._removed_files:
+                file_graph = self.store.read_file_graph(file_path)
+            return file_graph or {"variables": {}, "functions": {}}
+
+    def load_fingerprints(self):
+        """Load {file_path: {"mtime", "size", "hash"}} recorded with the graph cache."""
+        with self._lock:
+            if self._fingerprints is None:
+                # A current snapshot carries them, so the shards are not read
+                self._open_snapshot()
+                if isinstance(self._compiled, GraphSnapshot):
+                    try:
+                        self._fingerprints = self._compiled.fingerprints()
+                    except ValueError as e:
+                        print(f"⚠️  Ignoring graph snapshot: {e}")
+                        self._compiled = None
+            if self._fingerprints is None:
+                self._fingerprints = self.store.load_fingerprints()
+            return dict(self._fingerprints)
+
+    def save_fingerprints(self, fingerprints):
+        """Replace the fingerprints; only the ones that changed are written on the next flush."""
+        with self._lock:
+            old = self.load_fingerprints()
+            for file_path in old.keys() | fingerprints.keys():
+                if old.get(file_path) != fingerprints.get(file_path):
+                    self._fingerprint_updates[file_path] = fingerprints.get(file_path)
+            self._fingerprints = dict(fingerprints)
+
+    def flush(self):
+        """Persist the line cache and the shards of files changed since the last flush."""
+        with self._flush_lock:
+            self._flush_line_cache()
+            self._flush_graph()
+
+    def _flush_line_cache(self):
+        with self._lock:
+            if not self._line_cache_dirty:
+                return
+            # Baselines are replaced, never mutated, so a shallow copy is a
+            # consistent snapshot to serialize outside the lock.
+            line_cache = dict(self.line_cache)
+            self._line_cache_dirty = False
+        start = time.perf_counter()
+        try:
+            self.save_line_cache(line_cache)
+            self._observe_io("flush_lines", start)
+        except Exception:
+            with self._lock:
+                self._line_cache_dirty = True
+            raise
+
+    def _flush_graph(self):
+        with self._lock:
+            if not (self._pending or self._removed_files or self._fingerprint_updates):
+                return
+            # Per-file graphs are replaced, never mutated, so references
+            # are a consistent snapshot to serialize outside the lock.
+            changed = dict(self._pending)
+            removed = set(self._removed_files)
+            fingerprints, self._fingerprint_updates = self._fingerprint_updates, {}
+        start = time.perf_counter()
+        try:
+            self.store.write(changed, removed, fingerprints)
+        except Exception:
+            with self._lock:
+                # Keep any newer updates made meanwhile
+                self._fingerprint_updates = {**fingerprints, **self._fingerprint_updates}
+            raise
+        # Changes stay pending until they are in the store, so readers never
+        # see the store without them; newer changes made meanwhile stay
+        with self._lock:
+            for file_path, file_graph in changed.items():
+                if self._pending.get(file_path) is file_graph:
+                    del self._pending[file_path]
+                    if self._store_index:
+                        self._unindex_file(file_path)
+            self._removed_files -= removed
+        self._observe_io("flush", start)
+
+    def _observe_io(self, op, start):
+        if self.metrics is not None:
+            self.metrics.observe("code_watcher_graph_io_seconds", time.perf_counter() - start, op=op)
+
+    def start_flusher(self, interval=5.0):
+        """Flush dirty state from a background thread every interval seconds."""
+        if self._flusher is not None:
+            return
+        self._stop_flusher.clear()
+
+        def run():
+            while not self._stop_flusher.wait(interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️  Failed to persist graph cache: {e}")
+
+        self._flusher = threading.Thread(target=run, name="graph-cache-flusher", daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """Stop the background flusher and persist any remaining state."""
+        if self._flusher is not None:
+            self._stop_flusher.set()
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self.store.close()
+
+    # -----------------------------
+    # Reverse-dependency index
+    # -----------------------------
+    def _ensure_dependents_index(self):
+        if self._store_index:
+            return
+        if self._compiled is None:
+            self._open_snapshot()
+        if self._compiled is None:
+            self._reset_index(CompiledGraph.from_graph(self._read_graph()))
+
+    def _reset_index(self, compiled):
+        self._compiled = compiled
+        self._shadowed_files = set()
+        self._overlay_files = {}
+        self._dependents_by_short = {"variables": {}, "functions": {}}
+        self._dependents_by_name = {"variables": {}, "functions": {}}
+
+    def _open_snapshot(self):
+        """Use the snapshot as the compiled index if it matches the store and nothing is unflushed."""
+        if self._store_index or self._snapshot_checked or self._pending or self._removed_files:
+            return
+        self._snapshot_checked = True
+        if not os.path.exists(self.snapshot_file):
+            return
+        try:
+            snapshot = GraphSnapshot(self.snapshot_file)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable graph snapshot: {e}")
+            return
+        if snapshot.generation is not None and snapshot.generation == self.store.generation():
+            self._reset_index(snapshot)
+
+    def write_snapshot(self):
+        """
+        Flush, then write an mmap-able snapshot of the graph index and the
+        fingerprints, tagged with the store's generation, so later processes
+        can query it in place and start without reading the shards. Nothing
+        is written if the snapshot on disk is already current. Returns False
+        if new changes arrived before it was taken.
+        """
+        self.flush()
+        with self._lock:
+            if self._pending or self._removed_files:
+                return False
+            generation = self.store.generation()
+            if generation is not None and generation == self._snapshot_generation():
+                return True
+            if self._store_index:
+                compiled = CompiledGraph.from_graph(self._read_graph())
+            else:
+                self._ensure_dependents_index()
+                if self._overlay_files or self._shadowed_files or isinstance(self._compiled, GraphSnapshot):
+                    # Fold the overlay in; this also releases our mapping so the file can be replaced
+                    self._reset_index(CompiledGraph.from_graph(self._index_graph()))
+                compiled = self._compiled
+            fingerprints = self.load_fingerprints()
+        os.makedirs(self.graph_dir, exist_ok=True)
+        write_snapshot(self.snapshot_file, compiled, generation, fingerprints)
+        return True
+
+    def _snapshot_generation(self):
+        """Generation of the snapshot on disk, or None if there is no readable one."""
+        if isinstance(self._compiled, GraphSnapshot):
+            return self._compiled.generation
+        try:
+            return GraphSnapshot(self.snapshot_file).generation
+        except (OSError, ValueError):
+            return None
+
+    def _index_graph(self):
+        """Dict view of the index: the compiled graph with the overlay applied, in graph order."""
+        names = self._compiled.symbols
+        shadowed = {names[symbol] for symbol in self._shadowed_files}
+        graph = {}
+        for file_path, content in self._compiled.to_graph().items():
+            if file_path in self._overlay_files:
+                graph[file_path] = self._overlay_files[file_path]
+            elif file_path not in shadowed:
+                graph[file_path] = content
+        for file_path, content in self._overlay_files.items():
+            graph.setdefault(file_path, content)
+        return graph
+
+    def _update_index(self, changed, removed):
+        if self._store_index:
+            for file_path, content in changed.items():
+                self._index_file(file_path, content)
+            for file_path in removed:
+                self._unindex_file(file_path)
+            return
+        if self._compiled is None:
+            return
+        if len(self._overlay_files) + len(changed) > COMPILE_OVERLAY_LIMIT:
+            graph = self._index_graph()
+            for file_path in removed:
+                graph.pop(file_path, None)
+            graph.update(changed)
+            self._reset_index(CompiledGraph.from_graph(graph))
+            return
+        for file_path, content in changed.items():
+            self._index_file(file_path, content)
+        for file_path in removed:
+            self._unindex_file(file_path)
+            self._shadowed_files |= self._compiled.file_symbols([file_path])
+
+    def _index_entries(self, content):
+        """Yield (index, kind, key, dependent_name) for every edge of a file graph."""
+        for kind in ("variables", "functions"):
+            for name, data in content.get(kind, {}).items():
+                for dep in data.get("depends_on", []):
+                    yield self._dependents_by_short, kind, short_name(dep), name
+                    yield self._dependents_by_name, kind, dep, name
+
+    def _index_file(self, file_path, content):
+        """Move file_path into the overlay with its new graph."""
+        self._unindex_file(file_path)
+        if self._compiled is not None:
+            self._shadowed_files |= self._compiled.file_symbols([file_path])
+        self._overlay_files[file_path] = content
+        for index, kind, key, name in self._index_entries(content):
+            index[kind].setdefault(key, {}).setdefault(file_path, {})[name] = None
+
+    def _unindex_file(self, file_path):
+        content = self._overlay_files.pop(file_path, None)
+        if content is None:
+            return
+        for index, kind, key, _ in self._index_entries(content):
+            by_file = index[kind].get(key)
+            if by_file is None:
+                continue
+            by_file.pop(file_path, None)
+            if not by_file:
+                del index[kind][key]
+
+    def _dependents_of(self, name, kind, qualified=False):
+        if self._store_index:
+            dependents = self.store.dependents(
+                name, kind, qualified, exclude_files=self._pending.keys() | self._removed_files
+            )
+        else:
+            self._ensure_dependents_index()
+            dependents = self._compiled.dependents(name, kind, qualified, self._shadowed_files)
+        if qualified:
+            by_file = self._dependents_by_name[kind].get(name, {})
+        else:
+            by_file = self._dependents_by_short[kind].get(short_name(name), {})
+        for names in by_file.values():
+            dependents.extend(names)
+        return dependents
+
+    def get_dependents(self, name, kind="variables", qualified=False):
+        """
+        Return the names in category kind ("variables" or "functions") whose
+        depends_on mentions name, matched by unqualified short name unless
+        qualified=True.
+        """
+        with self._lock:
+            return self._dependents_of(name, kind, qualified)
 
     # -----------------------------
     # Recursive affected computation
@@ -123,41 +524,58 @@ class CacheManager:
         Cross-type dependencies (var→func or func→var) do not propagate
         unless the target is explicitly changed.
         """
-        graph = self.load_graph()
+        with self._lock:
+            return self._ordered_recursive_affected(changed_vars, changed_funcs)
+
+    def _ordered_recursive_affected(self, changed_vars, changed_funcs):
         ordered_vars, ordered_funcs = [], []
         visited_vars, visited_funcs = set(), set()
+        # Dependents depend only on the short name, which many names share
+        # (result, local_1, ...), so each list is looked up once per traversal.
+        # scanned[key] is a prefix of that list that is already visited:
+        # visited only grows, so every name with the same short name can
+        # resume there instead of rescanning the list from the start.
+        memo = {}
+        scanned = {}
 
-        def matches(dep, target):
-            """True if dependency matches unqualified target name."""
-            return dep.split(".")[-1] == target.split(".")[-1]
+        def dependents_of(name, kind):
+            key = (kind, short_name(name))
+            if key not in memo:
+                memo[key] = self._dependents_of(name, kind)
+                scanned[key] = 0
+            return key
 
-        def visit_var(var):
-            if var in visited_vars:
+        def visit(start, kind, visited, ordered):
+            # Iterative post-order DFS (deep dependency chains would overflow
+            # the recursion limit); entries are [name, key, position in list]
+            if start in visited:
                 return
-            visited_vars.add(var)
+            visited.add(start)
+            stack = [[start, dependents_of(start, kind), 0]]
+            while stack:
+                entry = stack[-1]
+                key = entry[1]
+                dependents = memo[key]
+                i = max(entry[2], scanned[key])
+                while i < len(dependents) and dependents[i] in visited:
+                    i += 1
+                scanned[key] = i
+                if i == len(dependents):
+                    stack.pop()
+                    ordered.append(entry[0])
+                    continue
+                dependent = dependents[i]
+                entry[2] = i + 1
+                visited.add(dependent)
+                stack.append([dependent, dependents_of(dependent, kind), 0])
 
+        def visit_var(var):
             # ✅ only propagate to *other variables* that depend on this var
-            for f_path, content in graph.items():
-                for v_name, v_data in content.get("variables", {}).items():
-                    for dep in v_data.get("depends_on", []):
-                        if matches(dep, var):
-                            visit_var(v_name)
-
-            ordered_vars.append(var)
+            visit(var, "variables", visited_vars, ordered_vars)
 
         def visit_func(func):
-            if func in visited_funcs:
-                return
-            visited_funcs.add(func)
-
             # ✅ only propagate to *other functions* that depend on this func
-            for f_path, content in graph.items():
-                for func_name, f_data in content.get("functions", {}).items():
-                    for dep in f_data.get("depends_on", []):
-                        if matches(dep, func):
-                            visit_func(func_name)
-
-            ordered_funcs.append(func)
+            visit(func, "functions", visited_funcs, ordered_funcs)
 
         # 🔹 Start traversal only within their own categories
         for v in changed_vars:
@@ -172,17 +590,20 @@ class CacheManager:
     # -----------------------------
     # Partial graph update
     # -----------------------------
-    def update_partial_graph(self, file_path, affected_vars, affected_funcs, full_graph):
+    def update_partial_graph(self, file_path, affected_vars, affected_funcs, full_graph, timer=None):
         """
         Update saved graph for a file and compute recursively affected elements.
+        With a timing.EventTimer, the update and the traversal are timed as
+        the "persist" and "propagate" stages.
         """
-        graph = self.load_graph()
-        graph[file_path] = full_graph
-        self.save_graph(graph)
+        with timer.span("persist") if timer else nullcontext(), self._lock:
+            self._ensure_dependents_index()
+            self._update_graph({file_path: full_graph}, ())
 
-        ordered_vars, ordered_funcs = self.get_ordered_recursive_affected(
-            affected_vars, affected_funcs
-        )
+        with timer.span("propagate") if timer else nullcontext():
+            ordered_vars, ordered_funcs = self.get_ordered_recursive_affected(
+                affected_vars, affected_funcs
+            )
 
         print(f"📊 Ordered affected variables: {ordered_vars}")
         print(f"📊 Ordered affected functions: {ordered_funcs}")
@@ -196,5 +617,28 @@ class CacheManager:
         Update the baseline content for a file so the current version
         becomes the new reference point for future change detection.
         """
-        self.line_cache[file_path] = new_file_lines
-        self.save_line_cache()
\ No newline at end of file
+        self.update_file_baselines({file_path: new_file_lines})
+
+    def update_file_baselines(self, baselines):
+        """
+        Update the baselines for many files at once ({file_path: lines}).
+        The line cache is persisted once, on the next flush.
+        """
+        with self._lock:
+            self.line_cache.update(baselines)
+            self._line_cache_dirty = True
+
+    def preload_baselines(self, project_path):
+        """Read every Python file under project_path as its baseline, in one batch."""
+        baselines = {}
+        for root, _, files in os.walk(project_path):
+            for f in files:
+                if f.endswith('.py'):
+                    file_path = os.path.join(root, f)
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as file:
+                            baselines[file_path] = file.readlines()
+                    except Exception as e:
+                        print(f"  Could not preload {file_path}: {e}")
+        self.update_file_baselines(baselines)
+        return len(baselines)
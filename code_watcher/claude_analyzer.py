@@ -1,48 +1,171 @@
 # claude_analyzer.py - Minimalist UI version
 import json
 import os
-import webbrowser
 import tempfile
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class ClaudeImpactAnalyzer:
-    def __init__(self, api_key):
+    def __init__(self, api_key, max_background_jobs=2, response_cache=None,
+                 pool_size=4, connect_timeout=10, read_timeout=120, max_retries=2,
+                 prompt_token_budget=8000, prompt_context_lines=3):
         self.api_key = api_key
         self.api_url = "https://api.anthropic.com/v1/messages"
-        
-        try:
-            import requests
-            self.requests = requests
-        except ImportError:
-            print("⚠️  'requests' library not found. Install it with: pip install requests")
-            self.requests = None
+        self.max_background_jobs = max_background_jobs
+        self.response_cache = response_cache
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._shut_down = False
+        self._running_jobs = 0
+        self._jobs_lock = threading.Lock()
+        # Pooled keep-alive HTTP session, created on first use and shared by all workers
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Files larger than the budget are sent as changed hunks plus affected definitions
+        self.prompt_token_budget = prompt_token_budget
+        self.prompt_context_lines = prompt_context_lines
+        self._requests = None
+
+    @property
+    def requests(self):
+        """The requests module, imported on the first API call (None if not installed)."""
+        if self._requests is None:
+            try:
+                import requests
+                self._requests = requests
+            except ImportError:
+                print("⚠️  'requests' library not found. Install it with: pip install requests")
+                self._requests = False
+        return self._requests or None
     
     def generate_impact_analysis(self, file_path, changed_lines, affected_vars, affected_funcs, 
                                  added_vars, added_funcs, deleted_vars, deleted_funcs,
-                                 affected_by_deletion, code_content):
+                                 affected_by_deletion, code_content, session=None, report_path=None,
+                                 timer=None):
         if not self.requests:
             print("❌ Cannot proceed without 'requests' library")
             return None
         
-        prompt = self._build_analysis_prompt(
-            file_path, changed_lines, affected_vars, affected_funcs,
-            added_vars, added_funcs, deleted_vars, deleted_funcs,
-            affected_by_deletion, code_content
-        )
-        
-        response = self._call_claude_api(prompt)
+        with timer.span("llm") if timer else nullcontext():
+            prompt = self._build_analysis_prompt(
+                file_path, changed_lines, affected_vars, affected_funcs,
+                added_vars, added_funcs, deleted_vars, deleted_funcs,
+                affected_by_deletion, code_content, session=session
+            )
+            response = self._call_claude_api(prompt)
         
         if response:
-            self._generate_visualization(response, file_path, changed_lines, 
-                                        affected_vars, affected_funcs)
-            return response
+            with timer.span("render") if timer else nullcontext():
+                rendered = self._generate_visualization(response, file_path, changed_lines, 
+                                                        affected_vars, affected_funcs, session=session,
+                                                        report_path=report_path)
+            # None also tells the background job to close out the pending report
+            return response if rendered else None
         
         return None
+
+    # -----------------------------
+    # Background analysis
+    # -----------------------------
+    def write_local_report(self, file_path, changed_lines, affected_vars, affected_funcs, session=None):
+        """
+        Write and open the report with local results only. The AI section is
+        marked pending and the page refreshes until the analysis is attached.
+        Returns the report path.
+        """
+        report_path = self._new_report_path()
+        self._write_report(report_path, file_path, changed_lines, affected_vars, affected_funcs,
+                           analysis_text="", session=session, pending=True)
+        print(f"✅ Local impact report saved to: {report_path}")
+        print("🌐 Opening in browser...")
+        import webbrowser
+        webbrowser.open('file://' + report_path)
+        return report_path
+
+    def submit_impact_analysis(self, **kwargs):
+        """
+        Run generate_impact_analysis on a background thread and return its Future.
+        Pass report_path from write_local_report to attach the result to that report.
+        """
+        with self._executor_lock:
+            if self._shut_down:
+                raise RuntimeError("Claude analyzer has been shut down")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.max_background_jobs), thread_name_prefix="claude-analysis"
+                )
+            return self._executor.submit(self._run_background_analysis, kwargs)
+
+    def _run_background_analysis(self, kwargs):
+        with self._jobs_lock:
+            self._running_jobs += 1
+        try:
+            try:
+                response = self.generate_impact_analysis(**kwargs)
+            except Exception as e:
+                print(f"⚠️  Claude analysis failed: {e}")
+                response = None
+
+            report_path = kwargs.get("report_path")
+            if response is None and report_path:
+                # Stop the pending page from refreshing forever
+                try:
+                    self._write_report(
+                        report_path, kwargs["file_path"], kwargs["changed_lines"],
+                        kwargs["affected_vars"], kwargs["affected_funcs"],
+                        analysis_text="Claude analysis is unavailable for this change.",
+                        session=kwargs.get("session")
+                    )
+                except Exception as e:
+                    print(f"⚠️  Failed to update report {report_path}: {e}")
+            return response
+        finally:
+            with self._jobs_lock:
+                self._running_jobs -= 1
+
+    def running_jobs(self):
+        """Number of background analyses currently calling the API or rendering."""
+        with self._jobs_lock:
+            return self._running_jobs
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting background jobs; queued jobs that have not started are
+        dropped. Jobs already running cannot be interrupted: with wait=True
+        this blocks until they finish (it may be called again after a
+        wait=False call to do so), then closes the HTTP session.
+        """
+        with self._executor_lock:
+            self._shut_down = True
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+        if wait:
+            with self._session_lock:
+                if self._session is not None:
+                    self._session.close()
+                    self._session = None
     
     def _build_analysis_prompt(self, file_path, changed_lines, affected_vars, affected_funcs,
                                added_vars, added_funcs, deleted_vars, deleted_funcs,
-                               affected_by_deletion, code_content):
+                               affected_by_deletion, code_content, session=None):
+        from analyzer import AnalysisSession
+
         file_name = os.path.basename(file_path)
+        session = session or AnalysisSession(file_path, code=code_content)
+        code_context, trimmed = self._build_code_context(
+            session, changed_lines, affected_vars, affected_funcs
+        )
+        if trimmed:
+            code_header = ("RELEVANT CODE (changed lines with context, then affected definitions; "
+                           "line numbers on the left, '...' marks omitted lines):")
+        else:
+            code_header = "CURRENT CODE:"
         
         prompt = f"""You are analyzing code changes for production deployment. Provide a detailed impact analysis.
 
@@ -50,17 +173,17 @@ FILE: {file_name}
 CHANGED LINES: {sorted(changed_lines)}
 
 CHANGE SUMMARY:
-- Added Variables: {len(added_vars)} → {list(added_vars) if added_vars else 'None'}
-- Added Functions: {len(added_funcs)} → {list(added_funcs) if added_funcs else 'None'}
-- Deleted Variables: {len(deleted_vars)} → {list(deleted_vars) if deleted_vars else 'None'}
-- Deleted Functions: {len(deleted_funcs)} → {list(deleted_funcs) if deleted_funcs else 'None'}
-- Modified Variables: {len(affected_vars)} → {list(affected_vars) if affected_vars else 'None'}
-- Modified Functions: {len(affected_funcs)} → {list(affected_funcs) if affected_funcs else 'None'}
-- Affected by Deletion: {len(affected_by_deletion)} → {list(affected_by_deletion) if affected_by_deletion else 'None'}
+- Added Variables: {len(added_vars)} → {sorted(added_vars) if added_vars else 'None'}
+- Added Functions: {len(added_funcs)} → {sorted(added_funcs) if added_funcs else 'None'}
+- Deleted Variables: {len(deleted_vars)} → {sorted(deleted_vars) if deleted_vars else 'None'}
+- Deleted Functions: {len(deleted_funcs)} → {sorted(deleted_funcs) if deleted_funcs else 'None'}
+- Modified Variables: {len(affected_vars)} → {sorted(affected_vars) if affected_vars else 'None'}
+- Modified Functions: {len(affected_funcs)} → {sorted(affected_funcs) if affected_funcs else 'None'}
+- Affected by Deletion: {len(affected_by_deletion)} → {sorted(affected_by_deletion) if affected_by_deletion else 'None'}
 
-CURRENT CODE:
+{code_header}
 ```python
-{code_content}
+{code_context}
 ```
 
 Please provide:
@@ -78,27 +201,100 @@ Format your response clearly with sections for each changed line and an overall
 Focus on ACTIONABLE insights for SME review before production deployment."""
 
         return prompt
+
+    @staticmethod
+    def _estimate_tokens(text):
+        """Rough token count (~4 characters per token)."""
+        return len(text) // 4 + 1
+
+    def _build_code_context(self, session, changed_lines, affected_vars, affected_funcs):
+        """
+        Choose the source to send with the prompt. Returns (code, trimmed).
+        The whole file is sent if it fits the token budget; otherwise the
+        changed lines (with a few lines of context) come first, then the
+        definitions of affected functions and variables, until the budget
+        is used up. Changed lines past the budget are left out with a note;
+        if the selection is no smaller than the file, the whole file is sent.
+        """
+        if self._estimate_tokens(session.code) <= self.prompt_token_budget:
+            return session.code, False
+
+        lines = session.lines
+        context = self.prompt_context_lines
+
+        def rendered(line_num):
+            return f"{line_num:>5}| {lines[line_num - 1].rstrip()}"
+
+        selected = set()
+        used = 0
+
+        # Changed lines first, in file order, as far as the budget allows
+        omitted_changes = 0
+        for line_num in sorted(changed_lines):
+            if 1 <= line_num <= len(lines) and line_num not in selected:
+                cost = self._estimate_tokens(rendered(line_num))
+                if omitted_changes or used + cost > self.prompt_token_budget:
+                    omitted_changes += 1
+                    continue
+                selected.add(line_num)
+                used += cost
+
+        candidates = []
+        for line_num in sorted(changed_lines):
+            candidates.append((max(1, line_num - context), min(len(lines), line_num + context)))
+        for name in sorted(affected_funcs) + sorted(affected_vars):
+            candidates.extend(session.definitions.get(name, []))
+
+        for start, end in candidates:
+            new_lines = [n for n in range(start, min(end, len(lines)) + 1) if n not in selected]
+            cost = sum(self._estimate_tokens(rendered(n)) for n in new_lines)
+            if used + cost > self.prompt_token_budget:
+                continue
+            selected.update(new_lines)
+            used += cost
+
+        output = []
+        previous = 0
+        for line_num in sorted(selected):
+            if line_num > previous + 1:
+                output.append("  ...")
+            output.append(rendered(line_num))
+            previous = line_num
+        if previous < len(lines):
+            output.append("  ...")
+        if omitted_changes:
+            output.append(f"  ... {omitted_changes} more changed line(s) omitted to fit the token budget")
+
+        code = "\n".join(output)
+        if self._estimate_tokens(code) >= self._estimate_tokens(session.code):
+            return session.code, False
+        return code, True
     
     def _call_claude_api(self, prompt):
         try:
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01"
-            }
-            
             payload = {
                 "model": "claude-sonnet-4-20250514",
                 "max_tokens": 4096,
                 "messages": [{"role": "user", "content": prompt}]
             }
+
+            cache_key = None
+            if self.response_cache:
+                cache_key = self.response_cache.key(payload)
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    print("♻️  Using cached Claude response for an identical request")
+                    return cached
             
             print("🤖 Calling Claude API for impact analysis...")
-            response = self.requests.post(self.api_url, headers=headers, json=payload, timeout=120)
+            response = self._get_session().post(self.api_url, json=payload, timeout=self.timeout)
             
             if response.status_code == 200:
                 result = response.json()
-                return result.get("content", [])
+                content = result.get("content", [])
+                if cache_key and content:
+                    self.response_cache.put(cache_key, content)
+                return content
             else:
                 print(f"❌ API Error: {response.status_code} - {response.text}")
                 return None
@@ -107,8 +303,41 @@ Focus on ACTIONABLE insights for SME review before production deployment."""
             print(f"❌ Failed to call Claude API: {e}")
             return None
     
+    def _get_session(self):
+        """Return the shared session, creating its connection pool on first use."""
+        with self._session_lock:
+            if self._session is None:
+                from urllib3.util.retry import Retry
+
+                # Retry connection failures and throttling/overload responses only:
+                # a read timeout means the POST reached the API and may still be
+                # generating (and billed), so it must not be sent again
+                retry = Retry(
+                    total=self.max_retries,
+                    connect=self.max_retries,
+                    read=0,
+                    other=0,
+                    backoff_factor=1,
+                    status_forcelist=(429, 500, 502, 503, 504, 529),
+                    allowed_methods=frozenset(["POST"]),
+                    raise_on_status=False,
+                )
+                adapter = self.requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry
+                )
+                session = self.requests.Session()
+                session.mount("https://", adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "x-api-key": self.api_key,
+                    "anthropic-version": "2023-06-01"
+                })
+                self._session = session
+            return self._session
+
     def _generate_visualization(self, claude_response, file_path, changed_lines, 
-                                affected_vars, affected_funcs):
+                                affected_vars, affected_funcs, session=None, report_path=None):
+        """Write the report with Claude's analysis. Returns True if it was written."""
         try:
             analysis_text = ""
             for content_block in claude_response:
@@ -117,39 +346,61 @@ Focus on ACTIONABLE insights for SME review before production deployment."""
             
             if not analysis_text:
                 print("⚠️  No analysis text received from Claude")
-                return
-            
-            html_content = self._create_html_visualization(
-                file_path, changed_lines, affected_vars, affected_funcs, analysis_text
-            )
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_name = f"impact_analysis_{timestamp}.html"
-            temp_path = os.path.join(tempfile.gettempdir(), file_name)
+                return False
             
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            if report_path:
+                # The local report is already open and refreshes itself
+                self._write_report(report_path, file_path, changed_lines, affected_vars,
+                                   affected_funcs, analysis_text, session=session)
+                print(f"✅ Claude analysis attached to: {report_path}")
+                return True
+
+            temp_path = self._new_report_path()
+            self._write_report(temp_path, file_path, changed_lines, affected_vars,
+                               affected_funcs, analysis_text, session=session)
             
             print(f"✅ Visualization saved to: {temp_path}")
             print("🌐 Opening in browser...")
+            import webbrowser
             webbrowser.open('file://' + temp_path)
+            return True
                 
         except Exception as e:
             print(f"❌ Failed to generate visualization: {e}")
             import traceback
             traceback.print_exc()
+            return False
     
-    def _build_dependency_graphs_per_line(self, file_path, changed_lines, affected_vars, affected_funcs):
-        from analyzer import build_full_graph_for_file, analyze_file_changes
+    def _new_report_path(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        file_name = f"impact_analysis_{timestamp}.html"
+        return os.path.join(tempfile.gettempdir(), file_name)
+
+    def _write_report(self, report_path, file_path, changed_lines, affected_vars, affected_funcs,
+                      analysis_text, session=None, pending=False):
+        html_content = self._create_html_visualization(
+            file_path, changed_lines, affected_vars, affected_funcs, analysis_text,
+            session=session, pending=pending
+        )
+        # Write then rename so a refreshing browser never sees a partial page
+        tmp_path = report_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        os.replace(tmp_path, report_path)
+    
+    def _build_dependency_graphs_per_line(self, file_path, changed_lines, affected_vars, affected_funcs,
+                                          session=None):
+        from analyzer import AnalysisSession, attribute_changed_lines
         
-        full_graph = build_full_graph_for_file(file_path)
+        session = session or AnalysisSession(file_path)
+        full_graph = session.graph
         graphs_by_line = {}
         all_func_nodes = {}
         all_var_nodes = {}
         
-        for line_num in sorted(changed_lines):
-            line_affected_vars, line_affected_funcs = analyze_file_changes(file_path, [line_num])
-            
+        # One bitset propagation attributes impact to every changed line
+        attribution = attribute_changed_lines(file_path, changed_lines, session=session)
+        for line_num, (line_affected_vars, line_affected_funcs) in attribution.items():
             for func in line_affected_funcs:
                 if func not in all_func_nodes:
                     all_func_nodes[func] = set()
@@ -443,21 +694,30 @@ Focus on ACTIONABLE insights for SME review before production deployment."""
         
         return sections
     
-    def _create_html_visualization(self, file_path, changed_lines, affected_vars, affected_funcs, claude_analysis):
+    def _create_html_visualization(self, file_path, changed_lines, affected_vars, affected_funcs, claude_analysis,
+                                   session=None, pending=False):
         file_name = os.path.basename(file_path)
         changed_lines_str = ", ".join(map(str, sorted(changed_lines)))
         
-        graph_data = self._build_dependency_graphs_per_line(file_path, changed_lines, affected_vars, affected_funcs)
+        graph_data = self._build_dependency_graphs_per_line(
+            file_path, changed_lines, affected_vars, affected_funcs, session=session
+        )
         graph_json_str = json.dumps(graph_data)
         
         # Parse the analysis
         parsed_analysis = self._parse_claude_analysis(claude_analysis)
+        refresh_tag = ''
+        if pending:
+            parsed_analysis['risk_level'] = 'PENDING'
+            parsed_analysis['overview'] = 'Claude analysis in progress. This page refreshes automatically when it is ready.'
+            refresh_tag = '<meta http-equiv="refresh" content="10">'
         parsed_json_str = json.dumps(parsed_analysis)
         
         html = f'''<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
+    {refresh_tag}
     <title>Impact Analysis - {file_name}</title>
     <script src="https://unpkg.com/react@18/umd/react.production.min.js"></script>
     <script src="https://unpkg.com/react-dom@18/umd/react-dom.production.min.js"></script>
@@ -536,6 +796,7 @@ Focus on ACTIONABLE insights for SME review before production deployment."""
             }};
             
             const getRiskLevelColor = (risk) => {{
+                if (risk === 'PENDING') return '#6b7280';
                 if (risk === 'CRITICAL') return '#991b1b';
                 if (risk === 'HIGH') return '#dc2626';
                 if (risk === 'MEDIUM') return '#f59e0b';
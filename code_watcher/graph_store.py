@@ -0,0 +1,202 @@
+# graph_store.py
+import os
+import json
+import uuid
+import hashlib
+
+from binary_format import encode_graph, decode_graph, decode_graph_fingerprint
+
+MANIFEST_VERSION = 3
+
+
+class ShardedGraphStore:
+    """
+    On-disk dependency graph with one shard per source file.
+
+    Layout:
+      <root>/manifest.json        {"version", "files": [file_path, ...]}
+      <root>/generation           id of the last write
+      <root>/shards/<id>.bin      binary graph record and fingerprint (binary_format.py),
+                                  optionally zlib'd; <id> is shard_id(file_path)
+
+    A flush rewrites only the shards of changed files and the generation
+    file. The manifest lists the stored files and is rewritten only when
+    files are added or removed. Every write gets a new generation id, so
+    derived files (snapshots) can tell whether they still match the shards.
+    export_json() writes the whole graph as JSON for debugging.
+    """
+
+    def __init__(self, root, compress=False):
+        self.root = root
+        self.compress = compress
+        self.shard_dir = os.path.join(root, "shards")
+        self.manifest_file = os.path.join(root, "manifest.json")
+        self.generation_file = os.path.join(root, "generation")
+        self._generation = None
+        self._fingerprints = None   # {file_path: fingerprint}, read from the shards on first use
+        self.files = self._read_manifest()  # {file_path: None}, in graph order
+
+    # -----------------------------
+    # Manifest
+    # -----------------------------
+    def _read_manifest(self):
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                try:
+                    manifest = json.load(f)
+                except json.JSONDecodeError:
+                    manifest = {}
+            if manifest.get("version") == MANIFEST_VERSION:
+                try:
+                    with open(self.generation_file, "r", encoding="utf-8") as f:
+                        self._generation = f.read().strip() or None
+                except OSError:
+                    pass
+                return dict.fromkeys(manifest.get("files", []))
+        return {}
+
+    def generation(self):
+        """Id of the last write, or None if nothing has been written."""
+        return self._generation
+
+    def file_paths(self):
+        return list(self.files)
+
+    def load_fingerprints(self):
+        """Return {file_path: fingerprint} for files that have one (reads every shard once)."""
+        if self._fingerprints is None:
+            self._fingerprints = {}
+            for file_path in self.files:
+                fingerprint = self._read_fingerprint(file_path)
+                if fingerprint:
+                    self._fingerprints[file_path] = fingerprint
+        return dict(self._fingerprints)
+
+    # -----------------------------
+    # Shards
+    # -----------------------------
+    def _shard_path(self, file_path):
+        return os.path.join(self.shard_dir, self.shard_id(file_path) + ".bin")
+
+    @staticmethod
+    def shard_id(file_path):
+        return hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:20]
+
+    def _read_shard(self, file_path):
+        if file_path not in self.files:
+            return None
+        try:
+            with open(self._shard_path(file_path), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _read_fingerprint(self, file_path):
+        data = self._read_shard(file_path)
+        if data is None:
+            return None
+        try:
+            stored_path, fingerprint = decode_graph_fingerprint(data)
+        except ValueError:
+            return None
+        return fingerprint if stored_path == file_path else None
+
+    def read_file_graph(self, file_path):
+        """Return the stored graph for one file, or None if there is no valid shard."""
+        data = self._read_shard(file_path)
+        if data is None:
+            return None
+        try:
+            stored_path, file_graph = decode_graph(data)
+        except ValueError:
+            return None
+        if stored_path != file_path:
+            return None
+        return file_graph
+
+    def read_all(self):
+        """Return {file_path: graph} for every readable shard."""
+        graph = {}
+        for file_path in list(self.files):
+            file_graph = self.read_file_graph(file_path)
+            if file_graph is not None:
+                graph[file_path] = file_graph
+        return graph
+
+    def write(self, changed, removed=(), fingerprints=None):
+        """
+        Persist changed ({file_path: graph}) shards and drop removed files.
+        fingerprints ({file_path: fingerprint or None}), if given, updates
+        the fingerprints of those files; their shards are rewritten with it.
+        """
+        os.makedirs(self.shard_dir, exist_ok=True)
+        removed = set(removed)
+        fingerprints = fingerprints or {}
+
+        to_write = dict(changed)
+        for file_path in fingerprints:
+            if file_path in self.files and file_path not in to_write and file_path not in removed:
+                file_graph = self.read_file_graph(file_path)
+                if file_graph is not None:
+                    to_write[file_path] = file_graph
+
+        for file_path, file_graph in to_write.items():
+            if file_path in fingerprints:
+                fingerprint = fingerprints[file_path]
+            elif self._fingerprints is not None:
+                fingerprint = self._fingerprints.get(file_path)
+            else:
+                fingerprint = self._read_fingerprint(file_path)
+            self._write_bytes(self._shard_path(file_path),
+                              encode_graph(file_path, file_graph, self.compress, fingerprint))
+            if self._fingerprints is not None:
+                if fingerprint:
+                    self._fingerprints[file_path] = fingerprint
+                else:
+                    self._fingerprints.pop(file_path, None)
+
+        files = {f: None for f in [*self.files, *changed] if f not in removed}
+        if files.keys() != self.files.keys():
+            self._write_json(self.manifest_file, {"version": MANIFEST_VERSION, "files": list(files)})
+        for file_path in self.files.keys() - files.keys():
+            try:
+                os.remove(self._shard_path(file_path))
+            except OSError:
+                pass
+            if self._fingerprints is not None:
+                self._fingerprints.pop(file_path, None)
+        self.files = files
+
+        self._generation = uuid.uuid4().hex
+        self._write_bytes(self.generation_file, self._generation.encode("ascii"))
+
+    def close(self):
+        """Nothing to release; shards are opened per read and write."""
+
+    def export_json(self, path):
+        """Write {file_path: graph} for every stored shard to path as JSON."""
+        self._write_json(path, self.read_all())
+
+    @staticmethod
+    def _write_bytes(path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _write_json(path, obj):
+        """Write obj atomically (convert sets to lists)."""
+        def convert(o):
+            if isinstance(o, set):
+                return list(o)
+            if isinstance(o, dict):
+                return {k: convert(v) for k, v in o.items()}
+            if isinstance(o, list):
+                return [convert(i) for i in o]
+            return o
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(convert(obj), f)
+        os.replace(tmp_path, path)
@@ -1,54 +1,237 @@
 # main.py
 import os
 from analyzer import (
+    AnalysisSession,
     analyze_project, 
     analyze_file_changes, 
-    build_full_graph_for_file,
     get_added_variables,
     get_deleted_variables_impact
 )
 from watcher import watch_folder
 from cache_manager import CacheManager
-from claude_analyzer import ClaudeImpactAnalyzer
+from timing import EventTimer, StageStats, format_record
+from metrics import create_registry, start_metrics_server
 import sys
-from dotenv import load_dotenv
 
-# 🔧 Set your project path
-if len(sys.argv) < 1:
-    print("Please provide the project path as a command-line argument.")
-    sys.exit(1)
-PROJECT_PATH = sys.argv[1]
-OUTPUT_PATH = PROJECT_PATH+r"\output.txt"
+# Importing this module must stay cheap (test_setup.py, benchmark.py and
+# CI checks import it): the Claude client, the HTTP stack, the watchdog
+# observer and python-dotenv are imported only when first needed, and the
+# environment is read by load_settings() from main(), not at import. Check
+# with `python benchmark.py --import-budget <ms>`.
 
-# 🔧 Set your Claude API key
-load_dotenv()  # Load environment variables from .env file
 
-CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY") 
+def load_env_file():
+    """
+    Load the nearest .env file, searched from this folder upwards like
+    python-dotenv's load_dotenv(). python-dotenv is imported only if one exists.
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        env_path = os.path.join(folder, ".env")
+        if os.path.isfile(env_path):
+            from dotenv import load_dotenv
+            load_dotenv(env_path)
+            return
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return
+        folder = parent
 
 
-# Initialize Claude analyzer (set to None to disable)
-claude_analyzer = ClaudeImpactAnalyzer(CLAUDE_API_KEY) if CLAUDE_API_KEY else None
+# Settings: the defaults below, overridden from the environment (and .env)
+# by load_settings(), which main() calls before anything else.
 
+# 🔧 Set your Claude API key (CLAUDE_API_KEY in the environment or .env)
+CLAUDE_API_KEY = None
 
-def handle_change(file_path, cache):
-    output_file=open(OUTPUT_PATH,"a")
+# 🔧 Startup scan parallelism (ANALYSIS_WORKERS=1 disables the process pool)
+ANALYSIS_WORKERS = os.cpu_count() or 1
+ANALYSIS_CHUNKSIZE = 16
+
+# 🔧 Seconds between background writes of the in-memory graph cache
+GRAPH_FLUSH_INTERVAL = 5.0
+
+# 🔧 zlib-compress the binary graph shards and line cache (smaller files, slower saves)
+CACHE_COMPRESSION = False
+
+# 🔧 Graph cache backend: "shards" (one binary file per source file) or "sqlite" (indexed, multi-process)
+GRAPH_BACKEND = "shards"
+
+# 🔧 Write an mmap-able graph snapshot at startup and shutdown for fast index loads and queries
+GRAPH_SNAPSHOT = False
+
+# 🔧 Change processing: analysis worker threads and bounded queue size
+CHANGE_WORKERS = 4
+CHANGE_QUEUE_SIZE = 1000
+
+# 🔧 Debounce: analyze once a file has been quiet this long, but never wait more than the max delay
+DEBOUNCE_INTERVAL = 0.5
+DEBOUNCE_MAX_DELAY = 5.0
+
+# 🔧 Concurrent background Claude requests
+CLAUDE_BACKGROUND_JOBS = 2
+
+# 🔧 Claude HTTP client: pooled keep-alive connections, timeouts (seconds) and retries
+CLAUDE_POOL_SIZE = 4
+CLAUDE_CONNECT_TIMEOUT = 10.0
+CLAUDE_READ_TIMEOUT = 120.0
+CLAUDE_MAX_RETRIES = 2
+
+# 🔧 Approximate token budget for the code sent with each prompt
+CLAUDE_PROMPT_TOKEN_BUDGET = 8000
+
+# 🔧 Claude response cache: identical requests are answered locally
+CLAUDE_CACHE_ENTRIES = 256
+CLAUDE_CACHE_TTL = 7 * 24 * 3600.0
+
+# 🔧 Per-stage timings: rolling window size, summary every N events (0 = only at exit),
+# and an optional JSON-lines file that receives one record per event
+STAGE_STATS_WINDOW = 200
+STAGE_SUMMARY_EVERY = 50
+STAGE_TIMINGS_LOG = None
+
+# 🔧 Prometheus-format metrics endpoint at http://METRICS_HOST:METRICS_PORT/metrics (0 = disabled)
+METRICS_PORT = 0
+METRICS_HOST = "127.0.0.1"
+
+stage_stats = StageStats(window=STAGE_STATS_WINDOW, log_path=STAGE_TIMINGS_LOG)
+metrics = create_registry()
+
+
+def _env(name, default, parse=str):
+    """Environment variable parsed with parse, or default when unset."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        raise ValueError(f"{name}={value!r} is not a valid {parse.__name__}") from None
+
+
+def _flag(value):
+    return value == "1"
+
+
+def load_settings():
+    """
+    Load the .env file and read the 🔧 settings above from the environment.
+    Raises ValueError naming the variable when a number does not parse.
+    """
+    global CLAUDE_API_KEY, ANALYSIS_WORKERS, ANALYSIS_CHUNKSIZE, GRAPH_FLUSH_INTERVAL
+    global CACHE_COMPRESSION, GRAPH_BACKEND, GRAPH_SNAPSHOT, CHANGE_WORKERS, CHANGE_QUEUE_SIZE
+    global DEBOUNCE_INTERVAL, DEBOUNCE_MAX_DELAY, CLAUDE_BACKGROUND_JOBS, CLAUDE_POOL_SIZE
+    global CLAUDE_CONNECT_TIMEOUT, CLAUDE_READ_TIMEOUT, CLAUDE_MAX_RETRIES
+    global CLAUDE_PROMPT_TOKEN_BUDGET, CLAUDE_CACHE_ENTRIES, CLAUDE_CACHE_TTL
+    global STAGE_STATS_WINDOW, STAGE_SUMMARY_EVERY, STAGE_TIMINGS_LOG
+    global METRICS_PORT, METRICS_HOST, stage_stats
+
+    load_env_file()
+    CLAUDE_API_KEY = _env("CLAUDE_API_KEY", CLAUDE_API_KEY)
+    ANALYSIS_WORKERS = _env("ANALYSIS_WORKERS", ANALYSIS_WORKERS, int)
+    ANALYSIS_CHUNKSIZE = _env("ANALYSIS_CHUNKSIZE", ANALYSIS_CHUNKSIZE, int)
+    GRAPH_FLUSH_INTERVAL = _env("GRAPH_FLUSH_INTERVAL", GRAPH_FLUSH_INTERVAL, float)
+    CACHE_COMPRESSION = _env("CACHE_COMPRESSION", CACHE_COMPRESSION, _flag)
+    GRAPH_BACKEND = _env("GRAPH_BACKEND", GRAPH_BACKEND)
+    GRAPH_SNAPSHOT = _env("GRAPH_SNAPSHOT", GRAPH_SNAPSHOT, _flag)
+    CHANGE_WORKERS = _env("CHANGE_WORKERS", CHANGE_WORKERS, int)
+    CHANGE_QUEUE_SIZE = _env("CHANGE_QUEUE_SIZE", CHANGE_QUEUE_SIZE, int)
+    DEBOUNCE_INTERVAL = _env("DEBOUNCE_INTERVAL", DEBOUNCE_INTERVAL, float)
+    DEBOUNCE_MAX_DELAY = _env("DEBOUNCE_MAX_DELAY", DEBOUNCE_MAX_DELAY, float)
+    CLAUDE_BACKGROUND_JOBS = _env("CLAUDE_BACKGROUND_JOBS", CLAUDE_BACKGROUND_JOBS, int)
+    CLAUDE_POOL_SIZE = _env("CLAUDE_POOL_SIZE", CLAUDE_POOL_SIZE, int)
+    CLAUDE_CONNECT_TIMEOUT = _env("CLAUDE_CONNECT_TIMEOUT", CLAUDE_CONNECT_TIMEOUT, float)
+    CLAUDE_READ_TIMEOUT = _env("CLAUDE_READ_TIMEOUT", CLAUDE_READ_TIMEOUT, float)
+    CLAUDE_MAX_RETRIES = _env("CLAUDE_MAX_RETRIES", CLAUDE_MAX_RETRIES, int)
+    CLAUDE_PROMPT_TOKEN_BUDGET = _env("CLAUDE_PROMPT_TOKEN_BUDGET", CLAUDE_PROMPT_TOKEN_BUDGET, int)
+    CLAUDE_CACHE_ENTRIES = _env("CLAUDE_CACHE_ENTRIES", CLAUDE_CACHE_ENTRIES, int)
+    CLAUDE_CACHE_TTL = _env("CLAUDE_CACHE_TTL", CLAUDE_CACHE_TTL, float)
+    STAGE_STATS_WINDOW = _env("STAGE_STATS_WINDOW", STAGE_STATS_WINDOW, int)
+    STAGE_SUMMARY_EVERY = _env("STAGE_SUMMARY_EVERY", STAGE_SUMMARY_EVERY, int)
+    STAGE_TIMINGS_LOG = _env("STAGE_TIMINGS_LOG", STAGE_TIMINGS_LOG)
+    METRICS_PORT = _env("METRICS_PORT", METRICS_PORT, int)
+    METRICS_HOST = _env("METRICS_HOST", METRICS_HOST)
+    stage_stats = StageStats(window=STAGE_STATS_WINDOW, log_path=STAGE_TIMINGS_LOG)
+
+
+def create_claude_analyzer(project_path):
+    """Claude analyzer for project_path, or None when no API key is configured."""
+    if not CLAUDE_API_KEY:
+        return None
+    from claude_analyzer import ClaudeImpactAnalyzer
+    from response_cache import ResponseCache
+    return ClaudeImpactAnalyzer(
+        CLAUDE_API_KEY,
+        max_background_jobs=CLAUDE_BACKGROUND_JOBS,
+        response_cache=ResponseCache(
+            os.path.join(project_path, "claude_response_cache.json"),
+            max_entries=CLAUDE_CACHE_ENTRIES, ttl=CLAUDE_CACHE_TTL
+        ) if CLAUDE_CACHE_ENTRIES > 0 else None,
+        pool_size=CLAUDE_POOL_SIZE,
+        connect_timeout=CLAUDE_CONNECT_TIMEOUT,
+        read_timeout=CLAUDE_READ_TIMEOUT,
+        max_retries=CLAUDE_MAX_RETRIES,
+        prompt_token_budget=CLAUDE_PROMPT_TOKEN_BUDGET
+    )
+
+
+def handle_change(file_path, cache, output_path, claude_analyzer=None):
+    timer = EventTimer(file_path)
+    outcome = "error"
+    try:
+        with open(output_path, "a") as output_file:
+            outcome = process_change(file_path, cache, output_file, timer, claude_analyzer)
+    finally:
+        record_timing(timer.record(outcome))
+
+
+def record_timing(record):
+    print(format_record(record))
+    stage_stats.add(record)
+    record_metrics(record)
+    if STAGE_SUMMARY_EVERY and stage_stats.events % STAGE_SUMMARY_EVERY == 0:
+        print(stage_stats.format_summary())
+
+
+def record_metrics(record):
+    metrics.inc("code_watcher_events_total", phase=record["phase"], outcome=record["outcome"])
+    if record["outcome"] in ("error", "failed"):
+        metrics.inc("code_watcher_errors_total", phase=record["phase"])
+    if record["phase"] == "local":
+        metrics.observe("code_watcher_handle_change_seconds", record["total_ms"] / 1000)
+    for stage, ms in record["stages_ms"].items():
+        metrics.observe("code_watcher_stage_seconds", ms / 1000, stage=stage)
+    if "parse" in record["stages_ms"]:
+        metrics.inc("code_watcher_files_parsed_total", source="change")
+
+
+def process_change(file_path, cache, output_file, timer=None, claude_analyzer=None):
+    """
+    Analyze one change event. Stages are timed on timer (a timing.EventTimer);
+    without claude_analyzer the report and Claude stages are skipped.
+    Returns the outcome: "unchanged", "reordered" or "analyzed".
+    """
+    timer = timer or EventTimer(file_path)
     print(f"\nDetected change in: {file_path}")
     output_file.write(f"\nDetected change in: {file_path}\n")
-    # Step 1: Get old graph before changes
-    old_graph = cache.get_file_graph(file_path)
-    full_project_graph = cache.load_graph()
+    with timer.span("diff"):
+        # Step 1: Get old graph before changes
+        old_graph = cache.get_file_graph(file_path)
 
-    # Step 2: Get changed lines
-    changed_lines, new_file_lines, is_reorder_only, reorder_scope = cache.get_changed_lines(file_path)
-    if not changed_lines:
+        # Step 2: Get changed lines (the file is read and parsed once per event)
+        session = AnalysisSession(file_path)
+        changed_lines, new_file_lines, is_reorder_only, reorder_scope, hunks = cache.get_changed_lines(
+            file_path, session.lines if session.exists else None
+        )
+    if not hunks:
         print("No changes detected.")
         output_file.write("No changes detected.\n")
-        return
+        return "unchanged"
     
     # Step 2a: If only line order changed, just report that
     if is_reorder_only:
         from analyzer import get_functions_at_lines
-        affected_functions = get_functions_at_lines(file_path, changed_lines)
+        affected_functions = get_functions_at_lines(file_path, changed_lines, session=session)
         
         if reorder_scope == "file":
             print(" Line order changed (no content modification)")
@@ -61,13 +244,27 @@ def handle_change(file_path, cache):
             output_file.write(f"   In functions: {affected_functions}\n")
         
         # Update baseline and exit
-        cache.update_file_baseline(file_path, new_file_lines)
-        return
+        with timer.span("persist"):
+            cache.update_file_baseline(file_path, new_file_lines)
+        return "reordered"
     
     print(f"Changed lines: {changed_lines}")
     output_file.write(f"Changed lines: {changed_lines}\n")
+    deleted_lines = [
+        line_num
+        for hunk in hunks if hunk["type"] == "delete"
+        for line_num in range(hunk["old_start"], hunk["old_start"] + hunk["old_count"])
+    ]
+    if deleted_lines:
+        print(f"Deleted lines (previous version): {deleted_lines}")
+        output_file.write(f"Deleted lines (previous version): {deleted_lines}\n")
+    # Step 2b: Parse once; the analyses below reuse the session's tree and graph
+    with timer.span("parse"):
+        session.graph
+
     # Step 3: Check for ADDED variables/functions
-    added_vars, added_funcs = get_added_variables(file_path, old_graph)
+    with timer.span("added"):
+        added_vars, added_funcs = get_added_variables(file_path, old_graph, session=session)
     
     if added_vars or added_funcs:
         print(f"\n ADDED:")
@@ -80,9 +277,10 @@ def handle_change(file_path, cache):
             output_file.write(f"   Functions: {added_funcs}\n")
 
     # Step 4: Check for DELETED variables/functions and their impact
-    deleted_vars, deleted_funcs, affected_by_deletion = get_deleted_variables_impact(
-        file_path, old_graph, full_project_graph
-    )
+    with timer.span("deleted"):
+        deleted_vars, deleted_funcs, affected_by_deletion = get_deleted_variables_impact(
+            file_path, old_graph, None, session=session
+        )
     
     # Initialize these early so they're available later
     affected_vars_del = set()
@@ -99,8 +297,9 @@ def handle_change(file_path, cache):
             output_file.write(f"   Functions: {deleted_funcs}\n")
         
         if affected_by_deletion:
-            # Build the current graph to check types
-            new_graph = build_full_graph_for_file(file_path)
+            # Use the current graph to check types (the impact is computed
+            # over this file's new graph, so every item is in it)
+            new_graph = session.graph
             
             for item in affected_by_deletion:
                 # Check if it's in variables or functions
@@ -108,15 +307,6 @@ def handle_change(file_path, cache):
                     affected_vars_del.add(item)
                 elif item in new_graph.get("functions", {}):
                     affected_funcs_del.add(item)
-                else:
-                    # Fallback: check across all files in project
-                    for fpath, content in full_project_graph.items():
-                        if item in content.get("variables", {}):
-                            affected_vars_del.add(item)
-                            break
-                        elif item in content.get("functions", {}):
-                            affected_funcs_del.add(item)
-                            break
             
             print(f"\n  AFFECTED BY DELETION (downstream impacts):")
             output_file.write(f"\n  AFFECTED BY DELETION (downstream impacts):\n")    
@@ -128,7 +318,8 @@ def handle_change(file_path, cache):
                 output_file.write(f"   Functions: {affected_funcs_del}\n")
 
     # Step 5: Analyze changed lines in the file (for modified items)
-    affected_vars, affected_funcs = analyze_file_changes(file_path, changed_lines)
+    with timer.span("modified"):
+        affected_vars, affected_funcs = analyze_file_changes(file_path, changed_lines, session=session)
     
     # Remove added items from affected (they're new, not modified)
     affected_vars = affected_vars - added_vars
@@ -144,8 +335,8 @@ def handle_change(file_path, cache):
             print(f"   Functions: {affected_funcs}")
             output_file.write(f"   Functions: {affected_funcs}\n")
 
-    # Step 6: Build the full dependency graph for the file
-    full_graph = build_full_graph_for_file(file_path)
+    # Step 6: Full dependency graph for the file
+    full_graph = session.graph
 
     # Step 7: Combine all affected items for ordered list generation
     # Include deleted impacts in the ordering
@@ -153,19 +344,24 @@ def handle_change(file_path, cache):
     all_affected_funcs = affected_funcs | affected_funcs_del if affected_by_deletion else affected_funcs
     
     # Update cache and propagate dependencies recursively
-    cache.update_partial_graph(file_path, all_affected_vars, all_affected_funcs, full_graph)
+    cache.update_partial_graph(file_path, all_affected_vars, all_affected_funcs, full_graph, timer=timer)
+
+    # Step 8: Commit the new baseline before the slow AI stage, so the next
+    # save of this file is diffed against this version
+    with timer.span("persist"):
+        cache.update_file_baseline(file_path, new_file_lines)
 
-    # Step 8: Generate Claude Impact Analysis
+    # Step 9: Publish the local report now; Claude's analysis is attached
+    # to it by a background job when the API call completes
     if claude_analyzer:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                code_content = f.read()
-            
-            print("\n" + "="*60)
-            print("🤖 GENERATING CLAUDE IMPACT ANALYSIS...")
-            print("="*60)
-            
-            claude_analyzer.generate_impact_analysis(
+            with timer.span("render"):
+                report_path = claude_analyzer.write_local_report(
+                    file_path, changed_lines, affected_vars, affected_funcs, session=session
+                )
+            print("🤖 Claude impact analysis running in the background...")
+            llm_timer = timer.child("background")
+            future = claude_analyzer.submit_impact_analysis(
                 file_path=file_path,
                 changed_lines=changed_lines,
                 affected_vars=affected_vars,
@@ -175,47 +371,137 @@ def handle_change(file_path, cache):
                 deleted_vars=deleted_vars,
                 deleted_funcs=deleted_funcs,
                 affected_by_deletion=affected_by_deletion,
-                code_content=code_content
+                code_content=session.code,
+                session=session,
+                report_path=report_path,
+                timer=llm_timer
+            )
+            future.add_done_callback(
+                lambda f: record_timing(llm_timer.record(
+                    "cancelled" if f.cancelled() else "analyzed" if f.result() else "failed"
+                ))
             )
         except Exception as e:
             print(f"⚠️  Claude analysis failed: {e}")
-    
-    # Step 9: Update the baseline
-    cache.update_file_baseline(file_path, new_file_lines)
 
+    return "analyzed"
+
+
+def scan_project(cache, project_path):
+    """
+    Bring the graph cache up to date with the project folder. Only changed
+    files are parsed and stored; with a current graph snapshot the shards
+    are not read and the index is not recompiled.
+    """
+    fingerprints = cache.load_fingerprints()
+    scan_stats = {}
+    changed = analyze_project(
+        project_path, None, fingerprints,
+        workers=ANALYSIS_WORKERS, chunksize=ANALYSIS_CHUNKSIZE, stats=scan_stats, changed_only=True
+    )
+    for result, count in scan_stats.items():
+        metrics.inc("code_watcher_startup_files_total", count, result=result)
+    metrics.inc("code_watcher_files_parsed_total", scan_stats.get("parsed", 0), source="startup")
+    # fingerprints now lists every file found, apart from unreadable ones (which are in changed)
+    removed = set(cache.file_paths()) - set(fingerprints) - set(changed)
+    cache.update_graph(changed, removed)
+    cache.save_fingerprints(fingerprints)
+    cache.flush()
+
+
+def write_graph_snapshot(cache):
+    try:
+        cache.write_snapshot()
+    except OSError as e:
+        print(f"⚠️  Failed to write graph snapshot: {e}")
 
-def main():
-    print("Scanning project folder...")
-    cache = CacheManager(PROJECT_PATH)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 1:
+        print("Please provide the project path as a command-line argument.")
+        print("Usage: python main.py <project path>")
+        return 1
+    project_path = argv[0]
+    output_path = os.path.join(project_path, "output.txt")
+    try:
+        load_settings()
+    except ValueError as e:
+        print(f"❌ Invalid setting: {e}")
+        return 1
 
     # Step 0: make sure project path exists
-    if not os.path.exists(PROJECT_PATH):
-        print(f"Project path does not exist: {PROJECT_PATH}")
-        return
-    if not os.path.exists(OUTPUT_PATH):
+    if not os.path.exists(project_path):
+        print(f"Project path does not exist: {project_path}")
+        return 1
+    print("Scanning project folder...")
+    cache = CacheManager(project_path, compress=CACHE_COMPRESSION, backend=GRAPH_BACKEND, metrics=metrics)
+    if not os.path.exists(output_path):
         print("The file does not exist, creating a new one.")
-        open(OUTPUT_PATH, 'w', encoding='utf-8').close()
+        open(output_path, 'w', encoding='utf-8').close()
+    claude_analyzer = create_claude_analyzer(project_path)
 
 
-    # Step 1: full project analysis on startup
-    graph = analyze_project(PROJECT_PATH)
-    cache.save_graph(graph)
+    # Step 1: project analysis on startup (unchanged files reuse the cached graph)
+    scan_project(cache, project_path)
+    if GRAPH_SNAPSHOT:
+        write_graph_snapshot(cache)
     print(" Initial analysis complete.")
 
-    # Step 2: preload files (optional, for line cache)
-    for root, _, files in os.walk(PROJECT_PATH):
-        for f in files:
-            if f.endswith('.py'):
-                file_path = os.path.join(root, f)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        lines = file.readlines()
-                    cache.update_file_baseline(file_path, lines)
-                except Exception as e:
-                    print(f"  Could not preload {file_path}: {e}")
+    # Step 2: preload files (optional, for line cache), written in one batch
+    cache.preload_baselines(project_path)
+    cache.flush()
+
+    metrics_server = None
+    if METRICS_PORT:
+        response_cache = claude_analyzer.response_cache if claude_analyzer else None
+        if response_cache:
+            metrics.register_callback("code_watcher_claude_cache_hits_total", lambda: response_cache.hits)
+            metrics.register_callback("code_watcher_claude_cache_misses_total", lambda: response_cache.misses)
+        try:
+            metrics_server = start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+            print(f"📈 Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️  Failed to start metrics endpoint: {e}")
 
     print(" Watching for changes...\nPress Ctrl+C to stop.")
-    watch_folder(PROJECT_PATH, lambda f: handle_change(f, cache))
+    cache.start_flusher(GRAPH_FLUSH_INTERVAL)
+    try:
+        watch_folder(
+            project_path, lambda f: handle_change(f, cache, output_path, claude_analyzer),
+            workers=CHANGE_WORKERS, queue_size=CHANGE_QUEUE_SIZE,
+            debounce_interval=DEBOUNCE_INTERVAL, max_delay=DEBOUNCE_MAX_DELAY,
+            metrics=metrics
+        )
+    finally:
+        if metrics_server:
+            metrics_server.shutdown()
+        if claude_analyzer:
+            claude_analyzer.shutdown(wait=False)
+        if GRAPH_SNAPSHOT:
+            write_graph_snapshot(cache)
+        cache.close()
+        print(stage_stats.format_summary())
+        if claude_analyzer:
+            wait_for_claude(claude_analyzer)
+
+
+def wait_for_claude(claude_analyzer):
+    """
+    Wait for in-flight Claude requests (they cannot be interrupted, and the
+    interpreter would otherwise wait for them silently); a second Ctrl+C
+    exits at once and leaves their reports pending.
+    """
+    running = claude_analyzer.running_jobs()
+    if running:
+        print(f"⏳ Waiting for {running} Claude request(s) in flight "
+              f"(up to {CLAUDE_READ_TIMEOUT:.0f}s); press Ctrl+C again to quit now.")
+    try:
+        claude_analyzer.shutdown(wait=True)
+    except KeyboardInterrupt:
+        print("Quitting without waiting for Claude.")
+        sys.stdout.flush()
+        os._exit(130)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
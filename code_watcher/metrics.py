@@ -0,0 +1,148 @@
+# metrics.py
+import math
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=None):
+    items = sorted(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are declared once with describe(); instrumented code then calls
+    inc() / observe() with keyword labels. Values that already live on
+    another object (queue backlog, cache hits) are registered as callbacks
+    and read at scrape time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # name -> (type, help, buckets)
+        self._values = {}      # name -> {labels: value or histogram state}
+        self._callbacks = {}   # name -> [(labels, fn)]
+
+    def describe(self, name, metric_type, help_text, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            self._meta[name] = (metric_type, help_text, tuple(buckets) + (math.inf,))
+            self._values.setdefault(name, {})
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            buckets = self._meta[name][2]
+            state = self._values[name].get(key)
+            if state is None:
+                state = self._values[name][key] = {"counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def register_callback(self, name, fn, **labels):
+        """Report fn() as the value of a counter or gauge at scrape time."""
+        with self._lock:
+            self._callbacks.setdefault(name, []).append((tuple(sorted(labels.items())), fn))
+
+    def render(self):
+        with self._lock:
+            meta = dict(self._meta)
+            values = {name: dict(series) for name, series in self._values.items()}
+            histograms = {name: {key: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                                 for key, s in series.items()}
+                          for name, series in values.items() if meta[name][0] == "histogram"}
+            callbacks = {name: list(fns) for name, fns in self._callbacks.items()}
+
+        lines = []
+        for name, (metric_type, help_text, buckets) in meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "histogram":
+                for key, state in histograms[name].items():
+                    for bound, count in zip(buckets, state["counts"]):
+                        lines.append(f"{name}_bucket{_labels(key, [('le', _number(bound))])} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(state['sum'])}")
+                    lines.append(f"{name}_count{_labels(key)} {state['count']}")
+                continue
+            for key, value in values[name].items():
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+            for key, fn in callbacks.get(name, ()):
+                try:
+                    value = fn()
+                except Exception:
+                    continue
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def create_registry():
+    """Registry with every metric the watcher reports."""
+    registry = MetricsRegistry()
+    describe = registry.describe
+    describe("code_watcher_fs_events_total", "counter", "File system events received for .py files")
+    describe("code_watcher_events_total", "counter", "Change events processed, by phase and outcome")
+    describe("code_watcher_errors_total", "counter", "Change events that failed, by phase")
+    describe("code_watcher_dropped_events_total", "counter", "Change events dropped because the queue was full")
+    describe("code_watcher_queue_backlog", "gauge", "Changed files waiting for an analysis worker")
+    describe("code_watcher_queue_running", "gauge", "Files being analyzed right now")
+    describe("code_watcher_debounce_pending", "gauge", "Files waiting for their debounce quiet period")
+    describe("code_watcher_handle_change_seconds", "histogram", "Local handle_change latency")
+    describe("code_watcher_stage_seconds", "histogram", "handle_change stage latency (llm = Claude call)")
+    describe("code_watcher_graph_io_seconds", "histogram", "Graph cache load/save/flush time, by operation")
+    describe("code_watcher_files_parsed_total", "counter", "Python files parsed, by source (startup or change)")
+    describe("code_watcher_startup_files_total", "counter", "Files seen by the startup scan, by result")
+    describe("code_watcher_claude_cache_hits_total", "counter", "Claude responses served from the response cache")
+    describe("code_watcher_claude_cache_misses_total", "counter", "Claude requests not found in the response cache")
+    return registry
+
+
+def start_metrics_server(registry, host="127.0.0.1", port=9464):
+    """Serve registry.render() at http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
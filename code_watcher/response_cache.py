@@ -0,0 +1,78 @@
+# response_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Persistent LRU cache of Claude API responses.
+    Keys are a hash of the full request payload (model, prompt and
+    parameters). Entries older than ttl seconds are treated as misses, and
+    the least recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path, max_entries=256, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> {"created": timestamp, "response": ...}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def key(payload):
+        """Fingerprint a request payload."""
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = {"created": time.time(), "response": response}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            entries = list(self._entries.items())
+        try:
+            self._save(entries)
+        except OSError as e:
+            print(f"⚠️  Failed to persist Claude response cache: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                entries = json.load(f)
+            except json.JSONDecodeError:
+                return
+        now = time.time()
+        for key, entry in entries[-self.max_entries:]:
+            if now - entry.get("created", 0) <= self.ttl:
+                self._entries[key] = entry
+
+    def _save(self, entries):
+        # Stored oldest first so the LRU order survives a restart
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,179 @@
+# snapshot.py
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+from symbol_table import CompiledGraph
+
+# Read-only graph snapshot that is mmap'ed and queried in place.
+#
+#   header    magic, version, byte-order mark, section count, generation length
+#   table     (offset, length) per section, offsets 8-byte aligned
+#   sections  [0]  string offsets   u32, byte offsets into the string blob
+#             [1]  string blob      UTF-8
+#             [2]  sorted strings   u32 ids ordered by their UTF-8 bytes
+#             [3]  files            u32
+#             [4]  node_file        u32
+#             [5]  node_kind        i8
+#             [6]  node_name        u32
+#             [7]  dep_offsets      [8]  dep_targets          (forward CSR)
+#             [9]  by_short offsets [10] by_short nodes       (reverse CSR)
+#             [11] by_name offsets  [12] by_name nodes        (reverse CSR)
+#             [13] fingerprints     UTF-8 JSON {file_path: fingerprint}
+#
+# Arrays are in native byte order (the snapshot is a local cache, not an
+# exchange format) and are exposed as memoryview casts of the mapping, so
+# opening a snapshot allocates no per-symbol objects and processes that
+# open the same file share its page cache.
+
+MAGIC = b"CWSNAP\x00\x00"
+SNAPSHOT_VERSION = 2
+BYTE_ORDER_MARK = 0x01020304
+
+_HEADER = struct.Struct("=8sIIII")
+_SECTION = struct.Struct("=QQ")
+_SECTION_FORMATS = "IBIIIbIIIIIIIB"
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable snapshot."""
+
+
+class MappedStringTable:
+    """SymbolTable-compatible view of the snapshot's string sections."""
+
+    def __init__(self, offsets, blob, order):
+        self._offsets = offsets
+        self._blob = blob
+        self._order = order
+
+    def __getitem__(self, symbol):
+        return str(self._blob[self._offsets[symbol]:self._offsets[symbol + 1]], "utf-8", "surrogatepass")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _key(self, symbol):
+        return bytes(self._blob[self._offsets[symbol]:self._offsets[symbol + 1]])
+
+    def id_of(self, name):
+        """Binary search the sorted ids; return the id of name or None."""
+        key = name.encode("utf-8", "surrogatepass")
+        low, high = 0, len(self._order)
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(self._order[mid]) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self._order) and self._key(self._order[low]) == key:
+            return self._order[low]
+        return None
+
+
+class GraphSnapshot(CompiledGraph):
+    """
+    A CompiledGraph backed by an mmap'ed snapshot file. Queries
+    (dependents, file_symbols, to_graph) read the mapping directly.
+    fingerprints() returns the file fingerprints stored with it.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # empty file
+                raise SnapshotError(f"empty snapshot: {path}") from e
+        view = memoryview(self._mmap)
+
+        if len(view) < _HEADER.size:
+            raise SnapshotError("truncated header")
+        magic, version, byte_order, count, generation_length = _HEADER.unpack_from(view)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError("not a graph snapshot of this version")
+        if byte_order != BYTE_ORDER_MARK:
+            raise SnapshotError("snapshot was written on a machine with another byte order")
+        if count != len(_SECTION_FORMATS):
+            raise SnapshotError("unexpected section count")
+
+        pos = _HEADER.size
+        sections = []
+        for index in range(count):
+            offset, length = _SECTION.unpack_from(view, pos + index * _SECTION.size)
+            if offset + length > len(view):
+                raise SnapshotError("truncated section")
+            sections.append(view[offset:offset + length].cast(_SECTION_FORMATS[index]))
+        pos += count * _SECTION.size
+        self.generation = str(view[pos:pos + generation_length], "ascii") or None
+
+        (str_offsets, blob, order, files, node_file, node_kind, node_name,
+         dep_offsets, dep_targets, short_offsets, short_nodes, name_offsets, name_nodes,
+         self._fingerprints) = sections
+        super().__init__(MappedStringTable(str_offsets, blob, order), files, node_file, node_kind,
+                         node_name, dep_offsets, dep_targets,
+                         (short_offsets, short_nodes), (name_offsets, name_nodes))
+
+
+    def fingerprints(self):
+        """Return {file_path: fingerprint} as recorded when the snapshot was written."""
+        try:
+            return json.loads(str(self._fingerprints, "utf-8"))
+        except ValueError as e:
+            raise SnapshotError(f"corrupt fingerprints: {e}") from e
+
+
+def write_snapshot(path, compiled, generation=None, fingerprints=None):
+    """
+    Write compiled (a CompiledGraph) to path atomically, tagged with
+    generation and carrying fingerprints ({file_path: fingerprint}).
+    """
+    encoded = [name.encode("utf-8", "surrogatepass") for name in compiled.symbols.names]
+    str_offsets = array("I", [0])
+    for data in encoded:
+        str_offsets.append(str_offsets[-1] + len(data))
+    order = array("I", sorted(range(len(encoded)), key=encoded.__getitem__))
+
+    sections = [
+        str_offsets.tobytes(), b"".join(encoded), order.tobytes(),
+        array("I", compiled.files).tobytes(),
+        array("I", compiled.node_file).tobytes(),
+        array("b", compiled.node_kind).tobytes(),
+        array("I", compiled.node_name).tobytes(),
+        array("I", compiled.dep_offsets).tobytes(),
+        array("I", compiled.dep_targets).tobytes(),
+    ]
+    for offsets, nodes in (compiled.by_short, compiled.by_name):
+        sections += [array("I", offsets).tobytes(), array("I", nodes).tobytes()]
+    sections.append(json.dumps(fingerprints or {}).encode("utf-8"))
+
+    generation_bytes = (generation or "").encode("ascii")
+    pos = _HEADER.size + len(sections) * _SECTION.size + len(generation_bytes)
+    table = []
+    for data in sections:
+        pos += -pos % 8
+        table.append((pos, len(data)))
+        pos += len(data)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, BYTE_ORDER_MARK, len(sections), len(generation_bytes)))
+        for offset, length in table:
+            f.write(_SECTION.pack(offset, length))
+        f.write(generation_bytes)
+        for (offset, _), data in zip(table, sections):
+            f.write(b"\x00" * (offset - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    # python snapshot.py <graph.snapshot> <name> [variables|functions]  ->  who depends on name
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python snapshot.py <snapshot file> <name> [variables|functions]")
+        sys.exit(1)
+    snapshot = GraphSnapshot(sys.argv[1])
+    for dependent in snapshot.dependents(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else "variables"):
+        print(dependent)
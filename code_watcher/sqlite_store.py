@@ -0,0 +1,219 @@
+# sqlite_store.py
+import os
+import json
+import uuid
+import sqlite3
+import threading
+
+from symbol_table import KINDS
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+CREATE TABLE files (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT NOT NULL UNIQUE,
+    fingerprint TEXT
+);
+CREATE TABLE symbols (
+    id          INTEGER PRIMARY KEY,
+    file_id     INTEGER NOT NULL REFERENCES files(id),
+    kind        INTEGER NOT NULL,
+    position    INTEGER NOT NULL,
+    name        TEXT NOT NULL,
+    short_name  TEXT NOT NULL
+);
+CREATE TABLE edges (
+    symbol_id   INTEGER NOT NULL REFERENCES symbols(id),
+    position    INTEGER NOT NULL,
+    dep         TEXT NOT NULL,
+    dep_short   TEXT NOT NULL,
+    PRIMARY KEY (symbol_id, position)
+) WITHOUT ROWID;
+CREATE INDEX symbols_file ON symbols(file_id, kind, position);
+CREATE INDEX symbols_name ON symbols(name);
+CREATE INDEX symbols_short_name ON symbols(short_name);
+CREATE INDEX edges_dep ON edges(dep, symbol_id);
+CREATE INDEX edges_dep_short ON edges(dep_short, symbol_id);
+"""
+
+
+def _short_name(name):
+    return name.rsplit(".", 1)[-1]
+
+
+class SQLiteGraphStore:
+    """
+    Dependency graph kept in a local SQLite database, one row per symbol
+    and per depends_on edge, indexed by qualified name, short name, file
+    and reverse edge. Drop-in replacement for ShardedGraphStore.
+
+    Each write() is a single transaction, so a file's symbols and edges are
+    always replaced together. The database runs in WAL mode, so other
+    processes (e.g. a query CLI) can read while the watcher writes, and
+    "who depends on X" is answered by dependents() without loading the graph.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == SCHEMA_VERSION:
+                return
+            # Unknown or older schema: the graph cache is rebuilt on the next scan
+            self._conn.executescript(
+                "BEGIN;"
+                "DROP TABLE IF EXISTS edges; DROP TABLE IF EXISTS symbols;"
+                "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS meta;"
+                + SCHEMA + f"PRAGMA user_version = {SCHEMA_VERSION}; COMMIT;"
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def generation(self):
+        """Id of the last write, or None if nothing has been written."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else None
+
+    # -----------------------------
+    # Files and fingerprints
+    # -----------------------------
+    def file_paths(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM files ORDER BY id").fetchall()
+        return [path for (path,) in rows]
+
+    def load_fingerprints(self):
+        """Return {file_path: fingerprint} for files that have one."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, fingerprint FROM files WHERE fingerprint IS NOT NULL"
+            ).fetchall()
+        return {path: json.loads(fingerprint) for path, fingerprint in rows}
+
+    # -----------------------------
+    # Graph reads
+    # -----------------------------
+    def _graphs(self, where="", params=()):
+        """Rebuild {file_path: graph} for the files matching where."""
+        graphs, nodes = {}, {}
+        with self._lock:
+            for (path,) in self._conn.execute(f"SELECT path FROM files {where} ORDER BY id", params):
+                graphs[path] = {kind: {} for kind in KINDS}
+            rows = self._conn.execute(
+                f"""SELECT f.path, s.id, s.kind, s.name FROM symbols s
+                    JOIN files f ON f.id = s.file_id {where}
+                    ORDER BY f.id, s.kind, s.position""", params
+            ).fetchall()
+            for path, symbol_id, kind, name in rows:
+                nodes[symbol_id] = graphs[path][KINDS[kind]][name] = {"depends_on": []}
+            edges = self._conn.execute(
+                f"""SELECT e.symbol_id, e.dep FROM edges e
+                    JOIN symbols s ON s.id = e.symbol_id
+                    JOIN files f ON f.id = s.file_id {where}
+                    ORDER BY e.symbol_id, e.position""", params
+            ).fetchall()
+        for symbol_id, dep in edges:
+            nodes[symbol_id]["depends_on"].append(dep)
+        return graphs
+
+    def read_file_graph(self, file_path):
+        """Return the stored graph for one file, or None if it is not stored."""
+        return self._graphs("WHERE path = ?", (file_path,)).get(file_path)
+
+    def read_all(self):
+        """Return {file_path: graph} for every stored file."""
+        return self._graphs()
+
+    def dependents(self, name, kind="variables", qualified=False, exclude_files=()):
+        """
+        Return the names in category kind whose depends_on mentions name,
+        matched by unqualified short name unless qualified=True. Symbols of
+        the files in exclude_files are skipped.
+        """
+        column, key = ("dep", name) if qualified else ("dep_short", _short_name(name))
+        exclude_files = list(exclude_files)
+        exclude = ""
+        if exclude_files:
+            exclude = ("AND s.file_id NOT IN (SELECT id FROM files WHERE path IN (%s))"
+                       % ", ".join("?" * len(exclude_files)))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT s.name FROM symbols s
+                    WHERE s.kind = ? AND s.id IN (SELECT symbol_id FROM edges WHERE {column} = ?)
+                    {exclude}
+                    ORDER BY s.file_id, s.position""",
+                (KINDS.index(kind), key, *exclude_files),
+            ).fetchall()
+        return [name for (name,) in rows]
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+    def _delete_symbols(self, file_id):
+        self._conn.execute(
+            "DELETE FROM edges WHERE symbol_id IN (SELECT id FROM symbols WHERE file_id = ?)", (file_id,)
+        )
+        self._conn.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+
+    def write(self, changed, removed=(), fingerprints=None):
+        """
+        Replace the graphs of changed ({file_path: graph}) files, drop removed
+        files and update the fingerprints ({file_path: fingerprint or None})
+        of the files in fingerprints. All in one transaction.
+        """
+        with self._lock, self._conn:
+            conn = self._conn
+            for file_path, file_graph in changed.items():
+                conn.execute("INSERT OR IGNORE INTO files (path) VALUES (?)", (file_path,))
+                (file_id,) = conn.execute("SELECT id FROM files WHERE path = ?", (file_path,)).fetchone()
+                self._delete_symbols(file_id)
+                for kind_id, kind in enumerate(KINDS):
+                    for position, (name, data) in enumerate(file_graph.get(kind, {}).items()):
+                        symbol_id = conn.execute(
+                            "INSERT INTO symbols (file_id, kind, position, name, short_name) VALUES (?, ?, ?, ?, ?)",
+                            (file_id, kind_id, position, name, _short_name(name)),
+                        ).lastrowid
+                        conn.executemany(
+                            "INSERT INTO edges (symbol_id, position, dep, dep_short) VALUES (?, ?, ?, ?)",
+                            [(symbol_id, i, dep, _short_name(dep)) for i, dep in enumerate(data.get("depends_on", []))],
+                        )
+
+            for file_path in removed:
+                row = conn.execute("SELECT id FROM files WHERE path = ?", (file_path,)).fetchone()
+                if row is not None:
+                    self._delete_symbols(row[0])
+                    conn.execute("DELETE FROM files WHERE id = ?", row)
+
+            if fingerprints:
+                conn.executemany(
+                    "UPDATE files SET fingerprint = ? WHERE path = ?",
+                    [(json.dumps(fingerprint) if fingerprint else None, path)
+                     for path, fingerprint in fingerprints.items()],
+                )
+
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (uuid.uuid4().hex,)
+            )
+
+    def export_json(self, path):
+        """Write {file_path: graph} for every stored file to path as JSON."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.read_all(), f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,152 @@
+# symbol_table.py
+from array import array
+
+KINDS = ("variables", "functions")
+
+
+class SymbolTable:
+    """Interns strings (file paths, qualified and short names) as dense integer ids."""
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        symbol = self.ids.get(name)
+        if symbol is None:
+            symbol = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol
+
+    def id_of(self, name):
+        """Return the id of name, or None if it was never interned."""
+        return self.ids.get(name)
+
+    def __getitem__(self, symbol):
+        return self.names[symbol]
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _build_csr(pairs, size):
+    """
+    Pack (key, value) pairs into CSR arrays: the values for key k are
+    values[offsets[k]:offsets[k + 1]], in the order the pairs were given.
+    """
+    offsets = array("i", bytes(4 * (size + 1)))
+    for key, _ in pairs:
+        offsets[key + 1] += 1
+    for key in range(size):
+        offsets[key + 1] += offsets[key]
+
+    values = array("i", bytes(4 * len(pairs)))
+    cursor = offsets[:-1]
+    for key, value in pairs:
+        values[cursor[key]] = value
+        cursor[key] += 1
+    return offsets, values
+
+
+class CompiledGraph:
+    """
+    Immutable, array-backed view of the project graph.
+
+    Every variable/function is a node with an integer id; names are
+    interned in a SymbolTable. Forward edges (node -> depends_on symbols)
+    and reverse edges (dependency -> dependent nodes, keyed by short or
+    qualified name and by the dependent's kind) are stored as CSR arrays,
+    so traversals walk flat integer arrays instead of nested dicts of
+    strings. to_graph() exports the usual dict/JSON view.
+    """
+
+    def __init__(self, symbols, files, node_file, node_kind, node_name,
+                 dep_offsets, dep_targets, by_short, by_name):
+        self.symbols = symbols
+        self.files = files              # file path symbols, in graph order
+        self.node_file = node_file      # node -> file path symbol
+        self.node_kind = node_kind      # node -> index into KINDS
+        self.node_name = node_name      # node -> qualified name symbol
+        self.dep_offsets = dep_offsets  # forward CSR: node -> depends_on symbols
+        self.dep_targets = dep_targets
+        self.by_short = by_short        # reverse CSR: (short name symbol, kind) -> nodes
+        self.by_name = by_name          # reverse CSR: (qualified name symbol, kind) -> nodes
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Compile a {file_path: {"variables": ..., "functions": ...}} graph."""
+        symbols = SymbolTable()
+        files = array("i")
+        node_file, node_kind, node_name = array("i"), array("b"), array("i")
+        dep_offsets, dep_targets = array("i", [0]), array("i")
+        short_pairs, name_pairs = [], []
+
+        for file_path, content in graph.items():
+            file_symbol = symbols.intern(file_path)
+            files.append(file_symbol)
+            for kind_id, kind in enumerate(KINDS):
+                for name, data in content.get(kind, {}).items():
+                    node = len(node_name)
+                    node_file.append(file_symbol)
+                    node_kind.append(kind_id)
+                    node_name.append(symbols.intern(name))
+
+                    seen_short, seen_name = set(), set()
+                    for dep in data.get("depends_on", []):
+                        dep_symbol = symbols.intern(dep)
+                        dep_targets.append(dep_symbol)
+                        short_symbol = symbols.intern(dep.rsplit(".", 1)[-1])
+                        if short_symbol not in seen_short:
+                            seen_short.add(short_symbol)
+                            short_pairs.append((short_symbol * 2 + kind_id, node))
+                        if dep_symbol not in seen_name:
+                            seen_name.add(dep_symbol)
+                            name_pairs.append((dep_symbol * 2 + kind_id, node))
+                    dep_offsets.append(len(dep_targets))
+
+        size = 2 * len(symbols)
+        return cls(symbols, files, node_file, node_kind, node_name, dep_offsets, dep_targets,
+                   _build_csr(short_pairs, size), _build_csr(name_pairs, size))
+
+    def __len__(self):
+        return len(self.node_name)
+
+    def file_symbols(self, file_paths):
+        """Return the set of symbols for the given file paths that are in the graph."""
+        symbols = (self.symbols.id_of(file_path) for file_path in file_paths)
+        return {symbol for symbol in symbols if symbol is not None}
+
+    def dependent_nodes(self, name, kind="variables", qualified=False, exclude_files=()):
+        """
+        Yield the nodes of category kind whose depends_on mentions name,
+        matched by unqualified short name unless qualified=True. Nodes whose
+        file symbol is in exclude_files are skipped.
+        """
+        key = name if qualified else name.rsplit(".", 1)[-1]
+        symbol = self.symbols.id_of(key)
+        if symbol is None:
+            return
+        offsets, nodes = self.by_name if qualified else self.by_short
+        slot = symbol * 2 + KINDS.index(kind)
+        for node in nodes[offsets[slot]:offsets[slot + 1]]:
+            if self.node_file[node] not in exclude_files:
+                yield node
+
+    def dependents(self, name, kind="variables", qualified=False, exclude_files=()):
+        symbols = self.symbols
+        return [symbols[self.node_name[node]]
+                for node in self.dependent_nodes(name, kind, qualified, exclude_files)]
+
+    def to_graph(self):
+        """Export the dict/JSON view of the graph."""
+        names = self.symbols
+        graph = {names[file_symbol]: {kind: {} for kind in KINDS} for file_symbol in self.files}
+        for node in range(len(self.node_name)):
+            content = graph[names[self.node_file[node]]]
+            deps = self.dep_targets[self.dep_offsets[node]:self.dep_offsets[node + 1]]
+            content[KINDS[self.node_kind[node]]][names[self.node_name[node]]] = {
+                "depends_on": [names[dep] for dep in deps]
+            }
+        return graph
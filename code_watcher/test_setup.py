@@ -1,7 +1,9 @@
 # test_setup.py
 """
 Quick test to verify Claude Impact Analyzer setup
-Run this before starting the main watcher
+Run this before starting the main watcher:
+
+    python test_setup.py <project path>
 """
 
 import sys
@@ -37,12 +39,19 @@ def test_dependencies():
     return True
 
 
+def load_api_key():
+    """CLAUDE_API_KEY as main.py sees it (environment plus .env)."""
+    import main
+    main.load_settings()
+    return main.CLAUDE_API_KEY
+
+
 def test_api_key():
     """Check if API key is configured"""
     print("🔍 Checking API key configuration...\n")
     
     try:
-        from main import CLAUDE_API_KEY
+        CLAUDE_API_KEY = load_api_key()
         
         if not CLAUDE_API_KEY or CLAUDE_API_KEY == "your-api-key-here":
             print("❌ API key not configured!")
@@ -59,6 +68,9 @@ def test_api_key():
     except ImportError as e:
         print(f"❌ Could not import main.py: {e}")
         return False
+    except ValueError as e:
+        print(f"❌ Invalid setting: {e}")
+        return False
 
 
 def test_api_connection():
@@ -67,7 +79,7 @@ def test_api_connection():
     
     try:
         import requests
-        from main import CLAUDE_API_KEY
+        CLAUDE_API_KEY = load_api_key()
         
         headers = {
             "Content-Type": "application/json",
@@ -106,20 +118,24 @@ def test_api_connection():
         return False
 
 
-def test_project_path():
+def test_project_path(project_path):
     """Check if project path exists"""
     print("🔍 Checking project path...\n")
     
     try:
         import os
-        from main import PROJECT_PATH
-        
-        if os.path.exists(PROJECT_PATH):
-            print(f"✅ Project path exists: {PROJECT_PATH}")
+
+        if not project_path:
+            print("❌ No project path given")
+            print("   Run: python test_setup.py <project path>")
+            return False
+
+        if os.path.exists(project_path):
+            print(f"✅ Project path exists: {project_path}")
             
             # Count Python files
             py_files = []
-            for root, _, files in os.walk(PROJECT_PATH):
+            for root, _, files in os.walk(project_path):
                 for f in files:
                     if f.endswith('.py'):
                         py_files.append(os.path.join(root, f))
@@ -127,8 +143,8 @@ def test_project_path():
             print(f"   Found {len(py_files)} Python file(s) to monitor\n")
             return True
         else:
-            print(f"❌ Project path does not exist: {PROJECT_PATH}")
-            print("   Update PROJECT_PATH in main.py")
+            print(f"❌ Project path does not exist: {project_path}")
+            print("   Pass the folder to watch: python test_setup.py <project path>")
             return False
             
     except Exception as e:
@@ -147,7 +163,7 @@ def main():
     # Run all tests
     results.append(("Dependencies", test_dependencies()))
     results.append(("API Key", test_api_key()))
-    results.append(("Project Path", test_project_path()))
+    results.append(("Project Path", test_project_path(sys.argv[1] if len(sys.argv) > 1 else None)))
     results.append(("API Connection", test_api_connection()))
     
     # Summary
@@ -163,7 +179,7 @@ def main():
     
     if all(result[1] for result in results):
         print("🎉 All tests passed! Ready to run the watcher.")
-        print("   Start with: python main.py")
+        print("   Start with: python main.py <project path>")
         return 0
     else:
         print("⚠️  Some tests failed. Fix the issues above before running.")
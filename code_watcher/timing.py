@@ -0,0 +1,115 @@
+# timing.py
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Stage names used by handle_change and the background Claude job
+STAGES = ("diff", "parse", "added", "deleted", "modified", "propagate", "persist", "render", "llm")
+
+
+class EventTimer:
+    """
+    Named timing spans for one change event. Spans with the same name
+    accumulate, so a stage split across several calls is reported once.
+    """
+
+    def __init__(self, file_path, event_id=None, phase="local"):
+        self.file_path = file_path
+        self.event_id = event_id or uuid.uuid4().hex[:12]
+        self.phase = phase
+        self.timestamp = time.time()
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+
+    def child(self, phase):
+        """Timer for a later phase of the same event (e.g. the background Claude job)."""
+        return EventTimer(self.file_path, self.event_id, phase)
+
+    def record(self, outcome):
+        """Structured record of the event: per-stage and total durations in ms."""
+        return {
+            "event_id": self.event_id,
+            "phase": self.phase,
+            "file": self.file_path,
+            "timestamp": self.timestamp,
+            "outcome": outcome,
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+        }
+
+
+def format_record(record):
+    stages = " | ".join(f"{stage} {ms:.1f}ms" for stage, ms in record["stages_ms"].items())
+    return f"⏱️  [{record['phase']}] {record['total_ms']:.1f}ms total ({record['outcome']}): {stages}"
+
+
+class StageStats:
+    """
+    Rolling window of the most recent event records, with per-stage
+    percentiles. Records are optionally appended to a JSON-lines log.
+    """
+
+    def __init__(self, window=200, log_path=None):
+        self.log_path = log_path
+        self.events = 0
+        self._records = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._records.append(record)
+            self.events += 1
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record) + "\n")
+                except OSError as e:
+                    print(f"⚠️  Failed to write timing log: {e}")
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """{stage: {"count", "mean_ms", "p50_ms", "p95_ms", "max_ms"}} over the window."""
+        samples = {}
+        for record in self.records():
+            if record["phase"] == "local":
+                samples.setdefault("total", []).append(record["total_ms"])
+            for stage, ms in record["stages_ms"].items():
+                samples.setdefault(stage, []).append(ms)
+
+        order = {stage: i for i, stage in enumerate(STAGES + ("total",))}
+        summary = {}
+        for stage in sorted(samples, key=lambda s: order.get(s, len(order))):
+            values = sorted(samples[stage])
+            summary[stage] = {
+                "count": len(values),
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": values[(len(values) - 1) // 2],
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "max_ms": values[-1],
+            }
+        return summary
+
+    def format_summary(self):
+        summary = self.summary()
+        if not summary:
+            return "⏱️  No change events timed yet."
+        lines = [f"⏱️  Stage timings over the last {len(self._records)} record(s):",
+                 f"   {'stage':<10}{'count':>7}{'mean ms':>11}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}"]
+        for stage, s in summary.items():
+            lines.append(f"   {stage:<10}{s['count']:>7}{s['mean_ms']:>11.1f}{s['p50_ms']:>11.1f}"
+                         f"{s['p95_ms']:>11.1f}{s['max_ms']:>11.1f}")
+        return "\n".join(lines)
@@ -1,30 +1,204 @@
 # watcher.py
 import time
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import queue
+import threading
 
-class ChangeHandler(FileSystemEventHandler):
-    def __init__(self, callback, debounce_interval=0.5):
+class ChangeQueue:
+    """
+    Bounded queue of changed files processed by a pool of worker threads.
+    Events for the same file are serialized and coalesced: while a file is
+    queued or being analyzed, further events only mark it for one more run.
+    submit() never blocks, so the observer thread is never held up.
+    """
+
+    def __init__(self, callback, workers=4, maxsize=1000):
         self.callback = callback
-        self.debounce_interval = debounce_interval
-        self.last_called = {}
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._running = set()
+        self._rerun = set()
+        self.dropped = 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"change-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
 
-    def on_modified(self, event):
-        if not event.src_path.endswith(".py"):
-            return
+    def submit(self, file_path):
+        """Schedule file_path for analysis. Returns False if the queue is full."""
+        with self._lock:
+            if file_path in self._running:
+                self._rerun.add(file_path)
+                return True
+            if file_path in self._queued:
+                return True
+            return self._enqueue(file_path)
+
+    def _enqueue(self, file_path):
+        try:
+            self._queue.put_nowait(file_path)
+        except queue.Full:
+            self.dropped += 1
+            print(f"⚠️  Change queue full, dropping event for {file_path}")
+            return False
+        self._queued.add(file_path)
+        return True
+
+    def backlog(self):
+        """Number of files waiting for a worker."""
+        return self._queue.qsize()
+
+    def running(self):
+        """Number of files being analyzed right now."""
+        with self._lock:
+            return len(self._running)
+
+    def _work(self):
+        while True:
+            file_path = self._queue.get()
+            if file_path is None:
+                self._queue.task_done()
+                return
+
+            with self._lock:
+                self._queued.discard(file_path)
+                self._running.add(file_path)
+            try:
+                self._process(file_path)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, file_path):
+        # Reruns requested meanwhile are handled here, on the same worker, so
+        # they stay serialized and can't end up behind stop()'s sentinels.
+        while True:
+            try:
+                self.callback(file_path)
+            except Exception as e:
+                print(f"❌ Failed to process change in {file_path}: {e}")
+            with self._lock:
+                if file_path not in self._rerun:
+                    self._running.discard(file_path)
+                    return
+                self._rerun.discard(file_path)
+
+    def stop(self):
+        """Let the workers finish queued work and pending reruns, then shut them down."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class DebounceScheduler:
+    """
+    Trailing-edge debounce with per-file coalescing. A burst of events for
+    one file fires the callback once, after the file has been quiet for
+    quiet_period seconds, or max_delay seconds after the first event of the
+    burst if writes keep coming.
+    """
 
-        now = time.time()
-        last_time = self.last_called.get(event.src_path, 0)
+    def __init__(self, callback, quiet_period=0.5, max_delay=5.0):
+        self.callback = callback
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self._pending = {}  # file_path -> (first_event, last_event)
+        self.events = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="debounce-scheduler", daemon=True)
+        self._thread.start()
+
+    def touch(self, file_path):
+        """Record an event for file_path, restarting its quiet period."""
+        now = time.monotonic()
+        with self._cond:
+            self.events += 1
+            first_event, _ = self._pending.get(file_path, (now, now))
+            self._pending[file_path] = (first_event, now)
+            self._cond.notify()
+
+    def pending(self):
+        """Number of files waiting for their quiet period to end."""
+        with self._cond:
+            return len(self._pending)
+
+    def _deadline(self, first_event, last_event):
+        return min(last_event + self.quiet_period, first_event + self.max_delay)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                deadlines = {path: self._deadline(*times) for path, times in self._pending.items()}
+                due = [path for path, deadline in deadlines.items() if deadline <= now]
+                for path in due:
+                    del self._pending[path]
+                if not due:
+                    timeout = min(deadlines.values()) - now if deadlines else None
+                    self._cond.wait(timeout)
+                    continue
+            for path in due:
+                self.callback(path)
+
+    def stop(self):
+        """Stop the scheduler and fire any bursts that are still pending."""
+        with self._cond:
+            self._stopped = True
+            pending = list(self._pending)
+            self._pending.clear()
+            self._cond.notify()
+        self._thread.join()
+        for path in pending:
+            self.callback(path)
 
-        # Ignore if the same file was triggered very recently
-        if now - last_time < self.debounce_interval:
+
+class ChangeHandler:
+    """
+    watchdog event handler. It implements dispatch() itself instead of
+    subclassing FileSystemEventHandler, so importing this module does not
+    load watchdog; the observer backend is imported by watch_folder().
+    """
+
+    def __init__(self, callback, debounce_interval=0.5, max_delay=5.0):
+        self.scheduler = DebounceScheduler(callback, debounce_interval, max_delay)
+
+    def dispatch(self, event):
+        if event.is_directory:
             return
+        handler = getattr(self, f"on_{event.event_type}", None)
+        if handler:
+            handler(event)
+
+    def on_modified(self, event):
+        if event.src_path.endswith(".py"):
+            self.scheduler.touch(event.src_path)
+
+    def on_created(self, event):
+        self.on_modified(event)
+
+    def on_moved(self, event):
+        # Editors that save atomically write a temp file and rename it
+        if event.dest_path.endswith(".py"):
+            self.scheduler.touch(event.dest_path)
 
-        self.last_called[event.src_path] = now
-        self.callback(event.src_path)
+def watch_folder(folder_path, on_change, workers=4, queue_size=1000,
+                 debounce_interval=0.5, max_delay=5.0, metrics=None):
+    from watchdog.observers import Observer
 
-def watch_folder(folder_path, on_change):
-    event_handler = ChangeHandler(on_change)
+    changes = ChangeQueue(on_change, workers=workers, maxsize=queue_size)
+    event_handler = ChangeHandler(changes.submit, debounce_interval, max_delay)
+    if metrics is not None:
+        scheduler = event_handler.scheduler
+        metrics.register_callback("code_watcher_fs_events_total", lambda: scheduler.events)
+        metrics.register_callback("code_watcher_debounce_pending", scheduler.pending)
+        metrics.register_callback("code_watcher_queue_backlog", changes.backlog)
+        metrics.register_callback("code_watcher_queue_running", changes.running)
+        metrics.register_callback("code_watcher_dropped_events_total", lambda: changes.dropped)
     observer = Observer()
     observer.schedule(event_handler, folder_path, recursive=True)
     observer.start()
@@ -34,3 +208,5 @@ def watch_folder(folder_path, on_change):
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    event_handler.scheduler.stop()
+    changes.stop()